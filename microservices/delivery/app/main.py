@@ -1,74 +1,474 @@
 import os
+import math
 import random
 import aio_pika
-import json
+import aiormq.abc
+from aio_pika.exceptions import ChannelInvalidStateError
 from logger import logger
+from metrics import (
+    ACTIVE_WORKERS,
+    CONSUME_TO_PUBLISH_SECONDS,
+    IN_FLIGHT,
+    MESSAGES,
+    start_metrics_server,
+)
+from serialization import decode_message, encode_message
 import asyncio
+import time
 
 RABBITMQ_URL = os.getenv("RABBITMQ_URL")
+RABBITMQ_CHANNEL_POOL_SIZE = int(os.getenv("RABBITMQ_CHANNEL_POOL_SIZE", "4"))
+DELIVERY_PREFETCH_COUNT = int(os.getenv("DELIVERY_PREFETCH_COUNT", "100"))
+DELIVERY_MAX_WORKERS = int(os.getenv("DELIVERY_MAX_WORKERS", "50"))
+DELIVERY_ACK_BATCH_SIZE = int(os.getenv("DELIVERY_ACK_BATCH_SIZE", "50"))
+DELIVERY_ACK_INTERVAL = float(os.getenv("DELIVERY_ACK_INTERVAL", "0.05"))
+DELIVERY_PUBLISH_BATCH_SIZE = int(os.getenv("DELIVERY_PUBLISH_BATCH_SIZE", "100"))
+DELIVERY_PUBLISH_INTERVAL = float(os.getenv("DELIVERY_PUBLISH_INTERVAL", "0.02"))
+# Задержка между статусами доставки, сек (0 — все статусы сразу)
+DELIVERY_STATUS_DELAY_MIN = float(os.getenv("DELIVERY_STATUS_DELAY_MIN", "0"))
+DELIVERY_STATUS_DELAY_MAX = float(os.getenv("DELIVERY_STATUS_DELAY_MAX", "0"))
 statuses = ["in_assembly", "on_the_way", "delivered"]
+# Запись на каждый статус — отдельный логгер для сэмплирования (LOG_SAMPLING)
+status_logger = logger.getChild("status")
 
 
 class RabbitMQConnection:
-    def __init__(self):
+    """
+    Соединение с RabbitMQ: основной канал (объявления, потребление) и пул
+    каналов для публикации. Публикации распределяются по каналам пула по кругу,
+    закрытые каналы пересоздаются при выдаче.
+    """
+
+    def __init__(self, pool_size: int = RABBITMQ_CHANNEL_POOL_SIZE):
+        self.pool_size = max(pool_size, 1)
         self.connection = None
         self.channel = None
         self.exchange = None
+        self._pool: list[tuple] = []
+        self._next = 0
+        self._lock = asyncio.Lock()
 
     async def connect(self):
-        if not self.connection or self.connection.is_closed:
+        if self.connection and not self.connection.is_closed:
+            return self
+
+        async with self._lock:
+            if self.connection and not self.connection.is_closed:
+                return self
+
+            # Прежнее соединение и его каналы закрываем, а не бросаем
+            await self.close()
             self.connection = await aio_pika.connect_robust(RABBITMQ_URL)
-            self.channel = await self.connection.channel()
-            self.exchange = await self.channel.declare_exchange(
-                "marketplace", aio_pika.ExchangeType.DIRECT, durable=True
+            try:
+                self.channel, self.exchange = await self._open_channel()
+                self._pool = [await self._open_channel() for _ in range(self.pool_size)]
+            except Exception:
+                # Без пула соединение не считается установленным
+                await self.close()
+                raise
+            logger.info(
+                "Соединение с RabbitMQ установлено "
+                f"(каналов публикации: {self.pool_size})"
             )
-            logger.info("Соединение с RabbitMQ установлено")
         return self
 
+    async def _open_channel(self) -> tuple:
+        channel = await self.connection.channel(publisher_confirms=True)
+        exchange = await channel.declare_exchange(
+            "marketplace", aio_pika.ExchangeType.DIRECT, durable=True
+        )
+        return channel, exchange
+
+    async def get_exchange(self) -> aio_pika.abc.AbstractExchange:
+        """Exchange на следующем канале пула (round-robin) с проверкой живости канала"""
+        await self.connect()
+
+        index = self._next % self.pool_size
+        self._next = index + 1
+        channel, exchange = self._pool[index]
+
+        if channel.is_closed:
+            async with self._lock:
+                channel, exchange = self._pool[index]
+                if channel.is_closed:
+                    logger.warning(f"Канал публикации №{index} закрыт, пересоздаем")
+                    channel, exchange = await self._open_channel()
+                    self._pool[index] = (channel, exchange)
+
+        return exchange
+
     async def close(self):
         if self.connection:
             await self.connection.close()
             self.connection = None
             self.channel = None
             self.exchange = None
+            self._pool = []
             logger.info("Соединение с RabbitMQ закрыто")
 
 
 rabbit_connection = RabbitMQConnection()
 
 
-async def publish_delivery_status(order_id: int, status: str):
-    await rabbit_connection.connect()
-    exchange = rabbit_connection.exchange
+class StatusPublisher:
+    """
+    Буферизует сообщения delivery.action и публикует их пачками
+    (по batch_size или раз в flush_interval) на каналах публикации
+    с подтверждениями: подтверждения всей пачки ожидаются вместе
+    """
 
-    if exchange is None:
-        logger.error("RabbitMQ exchange не инициализирован")
-        return
+    def __init__(self, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rabbit_connection = None
+        self._buffer: list[tuple[bytes, str, asyncio.Future]] = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def start(self, rabbit_connection: RabbitMQConnection):
+        self.rabbit_connection = rabbit_connection
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def publish(self, body: bytes, content_type: str):
+        """Добавляет сообщение в пачку и ждет его подтверждения брокером"""
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((body, content_type, future))
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        await future
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        while self._buffer:
+            batch = self._buffer[: self.batch_size]
+            del self._buffer[: self.batch_size]
+
+            try:
+                # Пачка целиком уходит в один канал пула, канал — по кругу
+                exchange = await self.rabbit_connection.get_exchange()
+                results = await asyncio.gather(
+                    *(
+                        exchange.publish(
+                            aio_pika.Message(
+                                body=body,
+                                content_type=content_type,
+                                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                            ),
+                            routing_key="delivery.action",
+                        )
+                        for body, content_type, _ in batch
+                    ),
+                    return_exceptions=True,
+                )
+            except Exception as e:
+                results = [e] * len(batch)
+
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(None)
+
+
+class TimerWheel:
+    """
+    Хешированное колесо таймеров: отложенные действия раскладываются по слотам,
+    одна фоновая задача раз в tick запускает наступившие. Вместо отдельного
+    asyncio.sleep на каждый статус каждого заказа.
+    """
+
+    def __init__(self, tick: float = 0.1, slots: int = 512):
+        self.tick = tick
+        self._slots: list[list] = [[] for _ in range(slots)]
+        self._cursor = 0
+        self._task = None
+        # Запущенные действия: ссылка не дает event loop собрать задачу до завершения
+        self._tasks: set[asyncio.Task] = set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает тик и дожидается уже запущенных действий"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def schedule(self, delay: float, func, *args) -> asyncio.Future:
+        """Запускает func(*args) через delay секунд, future — результат выполнения"""
+        future = asyncio.get_running_loop().create_future()
+        if delay <= 0:
+            self._fire(future, func, args)
+            return future
+
+        ticks = max(1, math.ceil(delay / self.tick))
+        slot = (self._cursor + ticks) % len(self._slots)
+        rounds = (ticks - 1) // len(self._slots)
+        self._slots[slot].append([rounds, future, func, args])
+        return future
+
+    def _fire(self, future: asyncio.Future, func, args):
+        task = asyncio.create_task(func(*args))
+        self._tasks.add(task)
+
+        def done(task: asyncio.Task):
+            self._tasks.discard(task)
+            if task.cancelled():
+                if not future.done():
+                    future.cancel()
+                return
+            error = task.exception()
+            if future.done():
+                # Ожидающий уже отменен: ошибку некому получить, только в лог
+                if error is not None:
+                    logger.error(f"Ошибка отложенного действия: {error}")
+            elif error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(task.result())
+
+        task.add_done_callback(done)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            next_tick += self.tick
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+            self._cursor = (self._cursor + 1) % len(self._slots)
+            pending = []
+            for entry in self._slots[self._cursor]:
+                rounds, future, func, args = entry
+                if rounds:
+                    entry[0] -= 1
+                    pending.append(entry)
+                else:
+                    self._fire(future, func, args)
+            self._slots[self._cursor] = pending
 
+
+status_publisher = StatusPublisher(
+    DELIVERY_PUBLISH_BATCH_SIZE, DELIVERY_PUBLISH_INTERVAL
+)
+timer_wheel = TimerWheel()
+
+
+async def publish_delivery_status(order_id: int, status: str):
     delivery_action = {"order_id": order_id, "status": status}
-    message_body = bytes(json.dumps(delivery_action), encoding="utf-8")
-    message = aio_pika.Message(
-        body=message_body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT
-    )
+    message_body, content_type = encode_message(delivery_action)
 
-    await exchange.publish(message, routing_key="delivery.action")
-    logger.info(f"Публикация сообщения delivery.action: {delivery_action}")
+    # Слот воркера — только на публикацию: ожидание между статусами его не держит
+    async with workers:
+        with ACTIVE_WORKERS.track_inprogress():
+            await status_publisher.publish(message_body, content_type)
+    status_logger.info("Публикация сообщения delivery.action", extra=delivery_action)
 
 
-async def delivery_action(order_id: int):
+def schedule_delivery(order_id: int) -> asyncio.Future:
+    """
+    Раскладывает статусы заказа по колесу таймеров. Future завершается после
+    публикации последнего статуса или с первой ошибкой; корутина на время
+    доставки не создается
+    """
+    delay = 0.0
+    scheduled = []
     for status in statuses:
-        # await asyncio.sleep(random.randint(5, 10))
-        await publish_delivery_status(order_id, status)
+        scheduled.append(
+            timer_wheel.schedule(delay, publish_delivery_status, order_id, status)
+        )
+        delay += random.uniform(DELIVERY_STATUS_DELAY_MIN, DELIVERY_STATUS_DELAY_MAX)
+
+    return asyncio.gather(*scheduled)
+
+
+class BatchAcker:
+    """
+    Подтверждает обработанные сообщения пачками: один basic.ack(multiple=True)
+    на все сообщения до тега, ниже которого не осталось необработанных.
+
+    Теги доставки уникальны только в пределах канала, а robust-соединение после
+    переподключения открывает новый канал с тегами с начала: учет ведется
+    по каналам, сообщения закрытого канала брокер доставит повторно
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._outstanding: dict[aiormq.abc.AbstractChannel, set[int]] = {}
+        self._completed: dict[
+            aiormq.abc.AbstractChannel,
+            dict[int, aio_pika.abc.AbstractIncomingMessage],
+        ] = {}
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    @staticmethod
+    def _channel(message: aio_pika.abc.AbstractIncomingMessage):
+        """Канал, на который доставлено сообщение; None — канал уже закрыт"""
+        try:
+            return message.channel
+        except ChannelInvalidStateError:
+            return None
+
+    def track(self, message: aio_pika.abc.AbstractIncomingMessage):
+        channel = self._channel(message)
+        if channel is not None:
+            self._outstanding.setdefault(channel, set()).add(message.delivery_tag)
+
+    async def complete(self, message: aio_pika.abc.AbstractIncomingMessage):
+        channel = self._channel(message)
+        if channel is None:
+            return
+        self._outstanding.get(channel, set()).discard(message.delivery_tag)
+        self._completed.setdefault(channel, {})[message.delivery_tag] = message
+        if sum(map(len, self._completed.values())) >= self.batch_size:
+            await self.flush()
+
+    async def fail(
+        self, message: aio_pika.abc.AbstractIncomingMessage, requeue: bool = True
+    ):
+        channel = self._channel(message)
+        if channel is not None:
+            self._outstanding.get(channel, set()).discard(message.delivery_tag)
+        try:
+            await message.nack(requeue=requeue)
+        except Exception as e:
+            logger.error(f"Ошибка при nack сообщения: {e}")
+
+    async def flush(self):
+        for channel in list(self._completed.keys() | self._outstanding.keys()):
+            if channel.is_closed:
+                # Подтверждать некуда: неподтвержденные сообщения вернутся в очередь
+                self._outstanding.pop(channel, None)
+                self._completed.pop(channel, None)
+                continue
+            await self._flush_channel(channel)
+
+    async def _flush_channel(self, channel: aiormq.abc.AbstractChannel):
+        completed = self._completed.get(channel)
+        if not completed:
+            return
+
+        # multiple=True подтвердит и еще не обработанные сообщения с меньшим тегом,
+        # поэтому подтверждаем только ниже минимального необработанного
+        bound = min(self._outstanding.get(channel, ()), default=None)
+        tags = [tag for tag in completed if bound is None or tag < bound]
+        if not tags:
+            return
+
+        last = completed[max(tags)]
+        for tag in tags:
+            del completed[tag]
+
+        try:
+            await last.ack(multiple=True)
+        except Exception as e:
+            # Канал закрылся: неподтвержденные сообщения брокер доставит повторно
+            logger.error(f"Ошибка при подтверждении {len(tags)} сообщений: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+acker = BatchAcker(DELIVERY_ACK_BATCH_SIZE, DELIVERY_ACK_INTERVAL)
+workers = asyncio.Semaphore(DELIVERY_MAX_WORKERS)
+# Подтверждения завершенных доставок: ссылка до окончания ack/nack
+finishing: set[asyncio.Task] = set()
 
 
 async def handle_delivery_send(message: aio_pika.abc.AbstractIncomingMessage):
-    async with message.process():
-        order = json.loads(message.body.decode())
+    start = time.perf_counter()
+    acker.track(message)
+    IN_FLIGHT.inc()
+    try:
+        # JSON или msgpack — по content_type сообщения
+        order = decode_message(message.body, message.content_type)
         order_id = order.get("order_id")
-        asyncio.create_task(delivery_action(order_id))
+    except Exception as e:
+        logger.error(f"Некорректное сообщение delivery.send: {e}")
+        MESSAGES.labels("invalid").inc()
+        IN_FLIGHT.dec()
+        await acker.fail(message, requeue=False)
+        return
+
+    # Обработчик сразу возвращается: по завершении расписания колесо таймеров
+    # вызывает колбэк, который подтверждает сообщение
+    delivery = schedule_delivery(order_id)
+
+    def done(delivery: asyncio.Future):
+        task = asyncio.create_task(finish_delivery(message, order_id, delivery, start))
+        finishing.add(task)
+        task.add_done_callback(finishing.discard)
+
+    delivery.add_done_callback(done)
+
+
+async def finish_delivery(
+    message: aio_pika.abc.AbstractIncomingMessage,
+    order_id: int,
+    delivery: asyncio.Future,
+    start: float,
+):
+    IN_FLIGHT.dec()
+    error = asyncio.CancelledError() if delivery.cancelled() else delivery.exception()
+    if error is not None:
+        logger.error(f"Ошибка при доставке заказа №{order_id}: {error!r}")
+        MESSAGES.labels("failed").inc()
+        await acker.fail(message)
+        return
+
+    # Подтверждаем только после публикации всех статусов
+    MESSAGES.labels("ok").inc()
+    CONSUME_TO_PUBLISH_SECONDS.observe(time.perf_counter() - start)
+    await acker.complete(message)
 
 
 async def main():
+    start_metrics_server()
     await rabbit_connection.connect()
     channel = rabbit_connection.channel
     exchange = rabbit_connection.exchange
@@ -81,14 +481,23 @@ async def main():
         logger.error("RabbitMQ channel не инициализирован")
         return
 
+    await channel.set_qos(prefetch_count=DELIVERY_PREFETCH_COUNT)
     queue = await channel.declare_queue("delivery_send_queue", durable=True)
     await queue.bind(exchange, routing_key="delivery.send")
+    await status_publisher.start(rabbit_connection)
+    timer_wheel.start()
+    acker.start()
     await queue.consume(handle_delivery_send)
 
     logger.info("delivery-service запущен.")
     try:
         await asyncio.Future()
     finally:
+        await timer_wheel.stop()
+        await status_publisher.stop()
+        if finishing:
+            await asyncio.gather(*finishing, return_exceptions=True)
+        await acker.stop()
         await rabbit_connection.close()
 
 
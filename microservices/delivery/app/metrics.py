@@ -0,0 +1,28 @@
+import os
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+DELIVERY_METRICS_PORT = int(os.getenv("DELIVERY_METRICS_PORT", "8001"))
+
+MESSAGES = Counter(
+    "delivery_messages_total",
+    "Обработанные сообщения delivery.send: ok, failed (nack с возвратом), invalid",
+    ["result"],
+)
+CONSUME_TO_PUBLISH_SECONDS = Histogram(
+    "delivery_consume_to_publish_seconds",
+    "От получения delivery.send до подтверждения брокером последнего статуса",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+IN_FLIGHT = Gauge(
+    "delivery_in_flight_messages",
+    "Полученные и еще не подтвержденные сообщения (статусы ждут времени или публикуются)",
+)
+ACTIVE_WORKERS = Gauge(
+    "delivery_active_workers",
+    "Публикуемые статусы доставки (не больше DELIVERY_MAX_WORKERS)",
+)
+
+
+def start_metrics_server():
+    start_http_server(DELIVERY_METRICS_PORT)
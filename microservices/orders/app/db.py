@@ -1,18 +1,50 @@
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.metrics import DB_POOL_CHECKED_OUT, DB_POOL_CHECKOUT_SECONDS, DB_POOL_LIMIT
 import os
+import time
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_SIZE = 15
+DB_MAX_OVERFLOW = 15
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений с замером ожидания свободного соединения"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+
 
 engine = create_async_engine(
     str(DATABASE_URL),
     echo=False,
-    pool_size=15,
-    max_overflow=15,
+    poolclass=TimedAsyncAdaptedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
     pool_timeout=30,
     pool_pre_ping=True,
     pool_recycle=3600,
 )
 
+DB_POOL_LIMIT.set(DB_POOL_SIZE + DB_MAX_OVERFLOW)
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def on_pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_POOL_CHECKED_OUT.inc()
+
+
+@event.listens_for(engine.sync_engine, "checkin")
+def on_pool_checkin(dbapi_connection, connection_record):
+    DB_POOL_CHECKED_OUT.dec()
+
+
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
     expire_on_commit=False,
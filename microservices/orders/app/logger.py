@@ -1,9 +1,121 @@
+"""Логирование через очередь с сэмплированием, см. TECHNICAL_DETAILS.md §6.1"""
+
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+SERVICE_NAME = os.getenv("SERVICE_NAME", "orders")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Например "orders.publish=0.01,orders.timing=0.1"
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Стандартные атрибуты LogRecord; остальные пришли через extra и попадают в JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message",
+    "asctime",
+}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime(DATE_FORMAT, time.localtime(record.created))
+            + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "service": SERVICE_NAME,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю INFO/DEBUG записей логгера (и его потомков) по LOG_SAMPLING"""
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._cache: dict[str, float] = {}
+
+    def rate(self, name: str) -> float:
+        if name not in self._cache:
+            rate = 1.0
+            # Ближайший настроенный предок: orders.publish.confirm -> orders.publish
+            parts = name.split(".")
+            for i in range(len(parts), 0, -1):
+                prefix = ".".join(parts[:i])
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+            self._cache[name] = rate
+        return self._cache[name]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class LoopQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # В event loop только подставляем аргументы сообщения;
+        # JSON и трейсбек форматирует поток QueueListener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def parse_sampling(value: str) -> dict[str, float]:
+    rates = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, rate = item.split("=", 1)
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def setup_logging(stream=None) -> logging.handlers.QueueListener:
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LoopQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sampling(LOG_SAMPLING)))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    # Логи uvicorn (в том числе access на каждый запрос) — через ту же очередь
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    # Дописываем оставшиеся в очереди записи при завершении процесса
+    atexit.register(listener.stop)
+    return listener
 
-logging.basicConfig(
-    format="%(asctime)s %(levelname)s %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    level=logging.INFO,
-)
 
-logger = logging.getLogger(__name__)
+log_listener = setup_logging()
+logger = logging.getLogger(SERVICE_NAME)
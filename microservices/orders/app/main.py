@@ -1,18 +1,48 @@
+import asyncio
+import base64
+import json
+import os
 import random
 import time
 from contextlib import asynccontextmanager
 
 from app.db import AsyncSessionLocal, engine
 from app.logger import logger
+from app.metrics import (
+    CONTENT_TYPE_LATEST,
+    CREATE_ORDER_STAGE_SECONDS,
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS,
+    mark_process_dead,
+    metrics_payload,
+)
 from app.models import Base, Order, OrderItem, Product
-from app.producer import publish_order
+from app.order_writer import ORDER_WRITE_MODE, create_order_cte, order_batch_writer
+from app.outbox import (
+    ORDER_EVENTS_MODE,
+    order_created_event,
+    order_created_payload,
+    outbox_relay,
+)
+from app.price_sync import PRICE_SYNC_MODE, install_price_sync, price_sync
+from app.producer import order_publisher, publish_order
 from app.rabbit import RabbitMQConnection, get_rabbit, rabbit_connection
 from app.redis import redis_cache
+from app.response_cache import response_cache
 from app.schemas import OrderCreate, ProductIn, ProductOut
-from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Request
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
 from sqlalchemy import insert, select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+# Источник названий и цен товаров в GET /orders: db (JOIN с products) | cache (Redis)
+ORDERS_PRODUCT_SOURCE = os.getenv("ORDERS_PRODUCT_SOURCE", "db")
+
+products_adapter = TypeAdapter(list[ProductIn])
+# Время обработки запросов — отдельный логгер для сэмплирования (LOG_SAMPLING)
+timing_logger = logger.getChild("timing")
+
 
 async def get_db():
     async with AsyncSessionLocal() as session:
@@ -26,26 +56,80 @@ async def on_startup():
     except Exception as e:
         logger.fatal(f"Ошибка при инициализации БД: {e}")
 
+    if engine.dialect.name != "postgresql":
+        return
+    # Отдельной транзакцией: ошибка DDL не откатывает созданные таблицы.
+    # Без колонки version не работает запись товаров, без триггеров — синхронизация
+    # цен, поэтому старт прерывается
+    try:
+        async with engine.begin() as conn:
+            await install_price_sync(conn, notify=PRICE_SYNC_MODE == "notify")
+    except Exception as e:
+        logger.fatal(f"Ошибка при установке синхронизации цен: {e}")
+        raise
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    await on_startup()
-    await rabbit_connection.connect()
-    await redis_cache.connect()
 
+async def preload_prices():
     try:
         async with AsyncSessionLocal() as session:
             await redis_cache.preload_all_prices(session)
     except Exception as e:
         logger.error(f"Ошибка при предзагрузке Redis: {e}")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await on_startup()
+    await rabbit_connection.connect()
+    await order_publisher.start(rabbit_connection)
+    # Изменение цен/товаров сбрасывает и готовые ответы /products
+    redis_cache.add_invalidation_listener(response_cache.invalidate_products)
+    await redis_cache.connect()
+
+    # Запросы принимаются сразу: промахи кэша дочитываются из БД (read-through),
+    # готовность после предзагрузки сообщает /ready
+    preload_task = asyncio.create_task(preload_prices())
+
+    if ORDER_WRITE_MODE == "batch":
+        await order_batch_writer.start()
+    if ORDER_EVENTS_MODE == "outbox":
+        await outbox_relay.start()
+    if PRICE_SYNC_MODE == "notify":
+        await price_sync.start()
+
     yield
 
+    preload_task.cancel()
+    await asyncio.gather(preload_task, return_exceptions=True)
+    await order_batch_writer.stop()
+    await outbox_relay.stop()
+    await price_sync.stop()
+    await order_publisher.stop()
     await rabbit_connection.close()
     await redis_cache.disconnect()
+    mark_process_dead()
+
+
+# orjson вместо json.dumps для всех ответов по умолчанию
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
-app = FastAPI(lifespan=lifespan)
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Шаблон маршрута (/products/{product_id}), а не путь — ограниченное число меток
+        route = request.scope.get("route")
+        route = route.path if route else "unmatched"
+        HTTP_REQUESTS.labels(request.method, route, status).inc()
+        HTTP_REQUEST_SECONDS.labels(request.method, route).observe(
+            time.perf_counter() - start
+        )
 
 
 @app.get("/health", tags=["health"])
@@ -53,6 +137,42 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/ready", tags=["health"])
+async def readiness():
+    """Готовность к трафику: предзагрузка цен завершена (в том числе неуспешно)"""
+    status = redis_cache.preload_status()
+    if status["state"] in ("pending", "running"):
+        return ORJSONResponse(status, status_code=503)
+    return status
+
+
+@app.get("/metrics", tags=["health"])
+async def metrics():
+    return Response(content=metrics_payload(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/cache/stats", tags=["health"])
+async def cache_stats():
+    """Статистика кэша цен (L1), кэша ответов и попаданий по эндпоинтам каталога"""
+    return {
+        **redis_cache.get_stats(),
+        "responses": response_cache.stats(),
+        "endpoints": redis_cache.catalog_stats.stats(),
+    }
+
+
+@app.get("/publisher/stats", tags=["health"])
+async def publisher_stats():
+    """Статистика публикации с подтверждениями брокера"""
+    return order_publisher.stats()
+
+
+@app.get("/price-sync/stats", tags=["health"])
+async def price_sync_stats():
+    """Статистика синхронизации цен Postgres -> Redis"""
+    return price_sync.stats()
+
+
 @app.post("/orders", tags=["orders"])
 async def create_order(
     order: OrderCreate,
@@ -65,14 +185,17 @@ async def create_order(
     if not order.items:
         return {"error": "Заказ не может быть пустым"}
 
-    # 1. Получаем ВСЕ цены из кэша
+    # 1. Получаем ВСЕ цены из кэша (промахи дозагружаются из БД)
     product_ids = [item.product_id for item in order.items]
-    cached_prices = await redis_cache.get_product_prices_bulk(product_ids)
+    with CREATE_ORDER_STAGE_SECONDS.labels("price_lookup").time():
+        cached_prices = await redis_cache.get_product_prices_read_through(
+            product_ids, db
+        )
 
     # 2. Проверяем что все товары найдены
     missing_products = set(product_ids) - set(cached_prices.keys())
     if missing_products:
-        logger.error(f"Товары не найдены в кэше: {missing_products}")
+        logger.error(f"Товары не найдены: {missing_products}")
         return {"error": f"Товары не найдены: {missing_products}"}
 
     # 3. Вычисляем общую сумму
@@ -88,90 +211,191 @@ async def create_order(
         )
 
     # 4. Создаем заказ в БД
-    try:
-        new_order = Order(user_id=order.user_id)
-        db.add(new_order)
-        await db.flush()
-
-        # Batch insert для order_items
-        order_items = [
-            OrderItem(
-                order_id=new_order.id,
-                product_id=item.product_id,
-                quantity=item.quantity,
+    db_start = time.perf_counter()
+    if ORDER_WRITE_MODE == "batch":
+        try:
+            order_id = await order_batch_writer.submit(
+                order.user_id, order.items, total_price
             )
-            for item in order.items
-        ]
-        db.add_all(order_items)
-        await db.commit()
-
-    except Exception as e:
-        await db.rollback()
-        logger.error(f"Ошибка при создании заказа в БД: {e}")
-        return {"error": "Ошибка при создании заказа"}
+        except Exception:
+            return {"error": "Ошибка при создании заказа"}
+    elif ORDER_WRITE_MODE == "cte":
+        try:
+            order_id = await create_order_cte(
+                db, order.user_id, order.items, total_price
+            )
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Ошибка при создании заказа в БД: {e}")
+            return {"error": "Ошибка при создании заказа"}
+    else:
+        try:
+            new_order = Order(user_id=order.user_id)
+            db.add(new_order)
+            await db.flush()
+
+            # Batch insert для order_items
+            order_items = [
+                OrderItem(
+                    order_id=new_order.id,
+                    product_id=item.product_id,
+                    quantity=item.quantity,
+                )
+                for item in order.items
+            ]
+            db.add_all(order_items)
+
+            # Событие в той же транзакции, что и заказ
+            if ORDER_EVENTS_MODE == "outbox":
+                db.add(order_created_event(new_order.id, order.user_id, total_price))
+            await db.commit()
+
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Ошибка при создании заказа в БД: {e}")
+            return {"error": "Ошибка при создании заказа"}
+
+        order_id = new_order.id
+
+    db_elapsed = time.perf_counter() - db_start
+    CREATE_ORDER_STAGE_SECONDS.labels("db_write").observe(db_elapsed)
+    timing_logger.info(f"Запись заказа в БД заняла {db_elapsed:.4f} сек")
 
     # 5. Формируем ответ
-    order_response = {
-        "order_id": new_order.id,
-        "user_id": new_order.user_id,
-        "total_price": int(total_price),
-        "status": "created",
-    }
+    order_response = order_created_payload(order_id, order.user_id, total_price)
+
+    # 6. Отправляем в RabbitMQ: через outbox relay или напрямую
+    with CREATE_ORDER_STAGE_SECONDS.labels("publish").time():
+        if ORDER_EVENTS_MODE == "outbox":
+            outbox_relay.notify()
+        else:
+            # Ждем только передачи в конвейер публикации, не подтверждения брокера
+            await publish_order(order_response, rabbit_connection)
 
-    # 6. Отправляем в RabbitMQ в фоне (упрощенный payload)
-    # background_tasks.add_task(
-    #     publish_order,
-    #     {
-    #         "order_id": new_order.id,
-    #         "user_id": new_order.user_id,
-    #         "total_price": total_price,
-    #     },
-    #     rabbit_connection,
-    # )
-    await publish_order(order_response, rabbit_connection)
-
-    logger.info(f"Создание заказа заняло {time.perf_counter() - start:.4f} сек")
+    timing_logger.info(f"Создание заказа заняло {time.perf_counter() - start:.4f} сек")
     return order_response
 
 
+def encode_orders_cursor(order_id: int) -> str:
+    return base64.urlsafe_b64encode(str(order_id).encode()).decode()
+
+
+def decode_orders_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @app.get("/orders", tags=["orders"])
 async def get_orders(
     db: AsyncSession = Depends(get_db),
-    skip: int = 0,
-    limit: int = 10,
+    cursor: str | None = None,
+    limit: int = Query(10, ge=1, le=100),
+    user_id: int | None = None,
 ):
+    """Список заказов с keyset-пагинацией по orders.id"""
     start = time.perf_counter()
-    stmt = (
-        select(Order, OrderItem, Product)
-        .join(OrderItem, Order.id == OrderItem.order_id)  # явное указание условия JOIN
-        .join(
-            Product, OrderItem.product_id == Product.id
-        )  # явное указание условия JOIN
-        .offset(skip)
-        .limit(limit)
-    )
-    result = await db.execute(stmt)
-    logger.info(f"Получение заказов заняло {time.perf_counter() - start:.4f} сек")
-
-    # Обработка результата
-    orders_dict = {}
-    for order, order_item, product in result.all():
-        if order.id not in orders_dict:
-            orders_dict[order.id] = {
-                "id": order.id,
-                "user_id": order.user_id,
-                "items": [],
-            }
-
-        orders_dict[order.id]["items"].append(
-            {
-                "name": product.name,
-                "price": product.price,
-                "quantity": order_item.quantity,
-            }
+
+    # 1. Страница заказов: WHERE id > :last_id ORDER BY id LIMIT n + 1
+    stmt = select(Order.id, Order.user_id).order_by(Order.id).limit(limit + 1)
+    if cursor is not None:
+        stmt = stmt.where(Order.id > decode_orders_cursor(cursor))
+    if user_id is not None:
+        stmt = stmt.where(Order.user_id == user_id)
+
+    page = (await db.execute(stmt)).all()
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    orders_dict = {
+        row.id: {"id": row.id, "user_id": row.user_id, "items": []} for row in page
+    }
+
+    # 2. Позиции только для заказов страницы (индекс order_items.order_id)
+    if orders_dict and ORDERS_PRODUCT_SOURCE == "cache":
+        # Без JOIN с products: название и цена берутся из Redis одним MGET
+        items_stmt = (
+            select(OrderItem.order_id, OrderItem.product_id, OrderItem.quantity)
+            .where(OrderItem.order_id.in_(list(orders_dict)))
+            .order_by(OrderItem.order_id, OrderItem.id)
+        )
+        rows = (await db.execute(items_stmt)).all()
+        products = await redis_cache.get_products_read_through(
+            list({row.product_id for row in rows}), db
         )
+        for row in rows:
+            product = products.get(row.product_id, {})
+            orders_dict[row.order_id]["items"].append(
+                {
+                    "name": product.get("name"),
+                    "price": product.get("price"),
+                    "quantity": row.quantity,
+                }
+            )
+    elif orders_dict:
+        items_stmt = (
+            select(OrderItem.order_id, OrderItem.quantity, Product.name, Product.price)
+            .join(Product, OrderItem.product_id == Product.id)
+            .where(OrderItem.order_id.in_(list(orders_dict)))
+            .order_by(OrderItem.order_id, OrderItem.id)
+        )
+        for row in (await db.execute(items_stmt)).all():
+            orders_dict[row.order_id]["items"].append(
+                {"name": row.name, "price": row.price, "quantity": row.quantity}
+            )
 
-    return list(orders_dict.values())
+    timing_logger.info(
+        f"Получение заказов заняло {time.perf_counter() - start:.4f} сек"
+    )
+
+    return {
+        "orders": list(orders_dict.values()),
+        "next_cursor": encode_orders_cursor(page[-1].id) if has_more else None,
+    }
+
+
+@app.get("/orders/export", tags=["orders"])
+async def export_orders(since_id: int = 0):
+    """Выгрузка всех заказов в NDJSON потоком, since_id — продолжить после заказа"""
+    return StreamingResponse(
+        stream_orders_ndjson(since_id), media_type="application/x-ndjson"
+    )
+
+
+async def stream_orders_ndjson(since_id: int, chunk_size: int = 1000):
+    # Сессия живет в генераторе: Depends(get_db) закрывается до отправки тела ответа
+    async with AsyncSessionLocal() as session:
+        stmt = (
+            select(Order.id, Order.user_id, OrderItem.product_id, OrderItem.quantity)
+            .outerjoin(OrderItem, Order.id == OrderItem.order_id)
+            .where(Order.id > since_id)
+            .order_by(Order.id, OrderItem.id)
+            .execution_options(yield_per=chunk_size)
+        )
+        # Серверный курсор: строки читаются порциями по chunk_size
+        result = await session.stream(stmt)
+
+        current = None
+        lines = []
+        async for row in result:
+            if current is None or current["id"] != row.id:
+                if current is not None:
+                    lines.append(json.dumps(current))
+                    if len(lines) >= chunk_size:
+                        yield "\n".join(lines) + "\n"
+                        lines = []
+                current = {"id": row.id, "user_id": row.user_id, "items": []}
+
+            if row.product_id is not None:
+                current["items"].append(
+                    {"product_id": row.product_id, "quantity": row.quantity}
+                )
+
+        if current is not None:
+            lines.append(json.dumps(current))
+        if lines:
+            yield "\n".join(lines) + "\n"
 
 
 @app.get("/products", tags=["products"])
@@ -180,10 +404,19 @@ async def get_products(
     skip: int = 0,
     limit: int = 10,
 ):
-    start = time.perf_counter()
-    result = await db.execute(select(Product).offset(skip).limit(limit))
-    logger.info(f"Получение товаров заняло {time.perf_counter() - start:.4f} сек")
-    return result.scalars().all()
+    key = ("products", skip, limit)
+    body = response_cache.get(key)
+    if body is not None:
+        redis_cache.catalog_stats.record("GET /products", "local")
+    else:
+        start = time.perf_counter()
+        # Страница из Redis (ключ с версией каталога), промах — из БД
+        body = await redis_cache.get_catalog_page(skip, limit, db)
+        response_cache.set(key, body)
+        timing_logger.info(
+            f"Получение товаров заняло {time.perf_counter() - start:.4f} сек"
+        )
+    return Response(content=body, media_type="application/json")
 
 
 @app.post("/products", tags=["products"])
@@ -194,7 +427,90 @@ async def create_product(
     product = Product(name=product.name, price=product.price)
     db.add(product)
     await db.commit()
-    return product
+
+    # Новая версия каталога до инвалидации: реплики не перечитают старые страницы
+    await redis_cache.bump_catalog_version()
+    # Цена и карточка в кэш (заменяет отрицательную запись), сброс кэша ответов
+    await redis_cache.set_product_price(product.id, product.price)
+    await redis_cache.set_products_bulk(
+        {product.id: {"name": product.name, "price": product.price}}
+    )
+    return {"id": product.id, "name": product.name, "price": product.price}
+
+
+async def iter_products_json(request: Request, chunk_size: int):
+    products = products_adapter.validate_json(await request.body())
+    for i in range(0, len(products), chunk_size):
+        yield products[i : i + chunk_size]
+
+
+async def iter_products_ndjson(request: Request, chunk_size: int):
+    """Разбирает NDJSON по мере поступления тела запроса"""
+    buffer = b""
+    chunk = []
+    async for data in request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                chunk.append(ProductIn.model_validate_json(line))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+
+    if buffer.strip():
+        chunk.append(ProductIn.model_validate_json(buffer))
+    if chunk:
+        yield chunk
+
+
+@app.post("/products/bulk", tags=["products"])
+async def create_products_bulk(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    chunk_size: int = Query(1000, ge=1, le=10000),
+):
+    """Массовое добавление товаров (JSON-массив или NDJSON) с прогревом кэша"""
+    start = time.perf_counter()
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/x-ndjson"):
+        chunks = iter_products_ndjson(request, chunk_size)
+    else:
+        chunks = iter_products_json(request, chunk_size)
+
+    ids = []
+    products = {}
+    try:
+        async for chunk in chunks:
+            # Многострочный INSERT ... RETURNING id, порядок id совпадает с порядком товаров
+            result = await db.scalars(
+                insert(Product).returning(Product.id, sort_by_parameter_order=True),
+                [product.model_dump() for product in chunk],
+            )
+            chunk_ids = result.all()
+            ids.extend(chunk_ids)
+            for product_id, product in zip(chunk_ids, chunk):
+                products[product_id] = product.model_dump()
+        await db.commit()
+    except ValidationError as e:
+        await db.rollback()
+        # Без input: для битого JSON это исходные bytes, они не сериализуются в ответ
+        raise HTTPException(
+            status_code=422, detail=e.errors(include_url=False, include_input=False)
+        )
+
+    # Новые товары сразу доступны для заказа без /refresh-cache
+    if products:
+        await redis_cache.bump_catalog_version()
+        await redis_cache.set_product_prices_bulk(
+            {product_id: product["price"] for product_id, product in products.items()}
+        )
+        await redis_cache.set_products_bulk(products)
+
+    logger.info(
+        f"Добавление {len(ids)} товаров заняло {time.perf_counter() - start:.4f} сек"
+    )
+    return {"count": len(ids), "ids": ids}
 
 
 @app.get("/products/{product_id}", tags=["products"])
@@ -202,20 +518,36 @@ async def get_product(
     product_id: int,
     db: AsyncSession = Depends(get_db),
 ):
-    start = time.perf_counter()
-    result = await db.execute(select(Product).where(Product.id == product_id))
-    logger.info(f"Получение товара заняло {time.perf_counter() - start:.4f} сек")
-    return result.scalars().first()
+    key = ("product", product_id)
+    body = response_cache.get(key)
+    if body is not None:
+        redis_cache.catalog_stats.record("GET /products/{id}", "local")
+    else:
+        start = time.perf_counter()
+        body = await redis_cache.get_catalog_product(product_id, db)
+        timing_logger.info(
+            f"Получение товара заняло {time.perf_counter() - start:.4f} сек"
+        )
+        if body is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        response_cache.set(key, body)
+    return Response(content=body, media_type="application/json")
 
 
 @app.post("/products/{product_id}/refresh-cache", tags=["products"])
 async def refresh_product_cache(product_id: int, db: AsyncSession = Depends(get_db)):
     """Обновляет цену товара в кэше"""
-    result = await db.execute(select(Product).where(Product.id == product_id))
-    product = result.scalar_one_or_none()
+    result = await db.execute(
+        select(Product.name, Product.price).where(Product.id == product_id)
+    )
+    product = result.first()
 
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
+    await redis_cache.bump_catalog_version()
     await redis_cache.set_product_price(product_id, product.price)
+    await redis_cache.set_products_bulk(
+        {product_id: {"name": product.name, "price": product.price}}
+    )
     return {"status": "cache updated", "product_id": product_id, "price": product.price}
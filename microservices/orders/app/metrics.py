@@ -0,0 +1,94 @@
+import os
+
+# uvicorn запускается с несколькими воркерами: в multiprocess-режиме значения
+# пишутся в файлы PROMETHEUS_MULTIPROC_DIR и суммируются при чтении /metrics.
+# Каталог должен существовать до первой записи метрики
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Этапы запроса занимают от долей миллисекунды (L1, Redis) до секунд (БД под нагрузкой)
+FAST_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+)
+
+HTTP_REQUESTS = Counter(
+    "orders_http_requests_total",
+    "HTTP-запросы по маршрутам",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "orders_http_request_duration_seconds",
+    "Длительность HTTP-запросов по маршрутам",
+    ["method", "route"],
+    buckets=FAST_BUCKETS,
+)
+CREATE_ORDER_STAGE_SECONDS = Histogram(
+    "orders_create_order_stage_seconds",
+    "Длительность этапов POST /orders: price_lookup, db_write, publish",
+    ["stage"],
+    buckets=FAST_BUCKETS,
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "orders_db_pool_checkout_seconds",
+    "Ожидание соединения из пула SQLAlchemy",
+    buckets=FAST_BUCKETS,
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "orders_db_pool_checked_out",
+    "Соединения пула, выданные в данный момент",
+    multiprocess_mode="livesum",
+)
+DB_POOL_LIMIT = Gauge(
+    "orders_db_pool_limit",
+    "Максимум соединений пула (pool_size + max_overflow)",
+    multiprocess_mode="livesum",
+)
+REDIS_COMMAND_SECONDS = Histogram(
+    "orders_redis_command_seconds",
+    "Длительность команд Redis (пайплайн — одна команда PIPELINE)",
+    ["command"],
+    buckets=FAST_BUCKETS,
+)
+
+PRICE_PRELOAD_SECONDS = Gauge(
+    "orders_price_preload_seconds",
+    "Длительность предзагрузки цен при старте (загрузка или ожидание другой реплики)",
+    multiprocess_mode="livemax",
+)
+
+
+def metrics_payload() -> bytes:
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+def mark_process_dead():
+    """Убирает gauge-значения завершившегося воркера из multiprocess-файлов"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
@@ -1,7 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, Text
 from sqlalchemy.orm import relationship, declarative_base
 
-
 Base = declarative_base()
 
 
@@ -11,6 +10,9 @@ class Product(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     price = Column(Integer)
+    # Номер изменения из products_version_seq (триггер, app/price_sync.py):
+    # водяной знак сверки цен в Redis
+    version = Column(BigInteger, nullable=False, server_default="0", index=True)
 
 
 class Order(Base):
@@ -31,3 +33,11 @@ class OrderItem(Base):
     quantity = Column(Integer)
 
     order = relationship("Order", back_populates="items")
+
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True)
+    routing_key = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
@@ -0,0 +1,237 @@
+import asyncio
+import os
+
+from app.db import AsyncSessionLocal
+from app.logger import logger
+from app.models import Order, OrderItem, OutboxEvent
+from app.outbox import ORDER_EVENTS_MODE, order_created_event
+from sqlalchemy import Integer, Text, bindparam, cast, func, insert, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Способ записи заказа в БД:
+# orm (по запросу) | batch (микробатчинг) | cte (один запрос на заказ)
+ORDER_WRITE_MODE = os.getenv("ORDER_WRITE_MODE", "orm")
+
+
+def _build_create_order_stmt(with_event: bool = False):
+    """
+    WITH new_order AS (INSERT INTO orders ... RETURNING id),
+         new_items AS (INSERT INTO order_items SELECT ... FROM unnest(...))
+         [, new_event AS (INSERT INTO outbox SELECT ..., json_build_object(...))]
+    SELECT id FROM new_order
+    """
+    new_order = (
+        insert(Order.__table__)
+        .values(user_id=bindparam("user_id"))
+        .returning(Order.__table__.c.id)
+        .cte("new_order")
+    )
+    items = (
+        func.unnest(
+            bindparam("product_ids", type_=ARRAY(Integer)),
+            bindparam("quantities", type_=ARRAY(Integer)),
+        )
+        .table_valued("product_id", "quantity")
+        .render_derived(name="item")
+    )
+    new_items = (
+        insert(OrderItem.__table__)
+        .from_select(
+            ["order_id", "product_id", "quantity"],
+            select(new_order.c.id, items.c.product_id, items.c.quantity),
+        )
+        .cte("new_items")
+    )
+    stmt = select(new_order.c.id).add_cte(new_items)
+
+    if with_event:
+        payload = func.json_build_object(
+            "order_id",
+            new_order.c.id,
+            "user_id",
+            bindparam("user_id", type_=Integer),
+            "total_price",
+            bindparam("total_price", type_=Integer),
+            "status",
+            "created",
+        )
+        new_event = (
+            insert(OutboxEvent.__table__)
+            .from_select(
+                ["routing_key", "payload"],
+                select(literal("order.created"), cast(payload, Text)),
+            )
+            .cte("new_event")
+        )
+        stmt = stmt.add_cte(new_event)
+
+    return stmt
+
+
+create_order_stmt = _build_create_order_stmt()
+create_order_with_event_stmt = _build_create_order_stmt(with_event=True)
+
+
+async def create_order_cte(
+    db: AsyncSession, user_id: int, items: list, total_price: int
+) -> int:
+    """Создает заказ вместе с позициями одним запросом, без ORM unit of work"""
+    with_event = ORDER_EVENTS_MODE == "outbox"
+    result = await db.execute(
+        create_order_with_event_stmt if with_event else create_order_stmt,
+        {
+            "user_id": user_id,
+            "product_ids": [item.product_id for item in items],
+            "quantities": [item.quantity for item in items],
+            "total_price": int(total_price),
+        },
+    )
+    order_id = result.scalar_one()
+    await db.commit()
+    return order_id
+
+
+class OrderBatchWriter:
+    """Собирает одновременные заказы за короткое окно и пишет их одной транзакцией"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        max_batch_size: int = 100,
+        max_delay: float = 0.005,
+        max_concurrent_flushes: int = 4,
+        with_events: bool = False,
+    ):
+        self.session_factory = session_factory
+        self.with_events = with_events
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_concurrent_flushes = max_concurrent_flushes
+        self._queue: asyncio.Queue | None = None
+        self._task = None
+        self._flush_slots = None
+        self._flush_tasks: set[asyncio.Task] = set()
+
+    async def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._flush_slots = asyncio.Semaphore(self.max_concurrent_flushes)
+            self._task = asyncio.create_task(self._run())
+            logger.info(
+                f"Пакетная запись заказов включена: batch={self.max_batch_size}, "
+                f"окно={self.max_delay * 1000:.1f} мс"
+            )
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        # Дописываем то, что успело попасть в очередь
+        while not self._queue.empty():
+            await self._flush(self._drain([]))
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+
+    async def submit(self, user_id: int, items: list, total_price: int) -> int:
+        """Ставит заказ в очередь и возвращает его id после записи пачки"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((user_id, items, total_price, future))
+        return await future
+
+    def _drain(self, batch: list) -> list:
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                # Даем набраться пачке, если она еще не заполнена
+                if self._queue.qsize() < self.max_batch_size - 1:
+                    await asyncio.sleep(self.max_delay)
+                self._drain(batch)
+
+                await self._flush_slots.acquire()
+            except asyncio.CancelledError:
+                await self._flush(batch)
+                raise
+
+            task = asyncio.create_task(self._flush(batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._on_flush_done)
+
+    def _on_flush_done(self, task: asyncio.Task):
+        self._flush_tasks.discard(task)
+        self._flush_slots.release()
+
+    async def _flush(self, batch: list):
+        try:
+            order_ids = await self._write_batch(batch)
+        except Exception as e:
+            if len(batch) > 1:
+                # Одна ошибка не должна ронять всю пачку: пишем заказы по одному
+                logger.error(f"Ошибка пакетной записи заказов, пишем по одному: {e}")
+                for entry in batch:
+                    await self._flush([entry])
+                return
+
+            logger.error(f"Ошибка при создании заказа в БД: {e}")
+            future = batch[0][-1]
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        for (*_, future), order_id in zip(batch, order_ids):
+            if not future.done():
+                future.set_result(order_id)
+
+    async def _write_batch(self, batch: list) -> list[int]:
+        async with self.session_factory() as session:
+            try:
+                # Многострочный INSERT ... RETURNING id, порядок id совпадает с порядком пачки
+                result = await session.scalars(
+                    insert(Order).returning(Order.id, sort_by_parameter_order=True),
+                    [{"user_id": user_id} for user_id, *_ in batch],
+                )
+                order_ids = result.all()
+
+                order_items = [
+                    {
+                        "order_id": order_id,
+                        "product_id": item.product_id,
+                        "quantity": item.quantity,
+                    }
+                    for order_id, (_, items, *_) in zip(order_ids, batch)
+                    for item in items
+                ]
+                await session.execute(insert(OrderItem), order_items)
+
+                if self.with_events:
+                    session.add_all(
+                        order_created_event(order_id, user_id, total_price)
+                        for order_id, (user_id, _, total_price, _) in zip(
+                            order_ids, batch
+                        )
+                    )
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+        return order_ids
+
+
+order_batch_writer = OrderBatchWriter(
+    max_batch_size=int(os.getenv("ORDER_BATCH_MAX_SIZE", "100")),
+    max_delay=float(os.getenv("ORDER_BATCH_MAX_DELAY_MS", "5")) / 1000,
+    with_events=ORDER_EVENTS_MODE == "outbox",
+)
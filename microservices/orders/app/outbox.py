@@ -0,0 +1,142 @@
+import asyncio
+import json
+import os
+
+from app.db import AsyncSessionLocal
+from app.logger import logger
+from app.models import OutboxEvent
+from app.producer import ConfirmedPublisher, order_publisher
+from app.serialization import CONTENT_TYPE_JSON, MESSAGE_FORMAT, encode_message
+from sqlalchemy import delete, select
+
+# Доставка order.created: direct (публикация после commit) | outbox (через таблицу outbox)
+ORDER_EVENTS_MODE = os.getenv("ORDER_EVENTS_MODE", "direct")
+
+
+def order_created_payload(order_id: int, user_id: int, total_price: int) -> dict:
+    return {
+        "order_id": order_id,
+        "user_id": user_id,
+        "total_price": int(total_price),
+        "status": "created",
+    }
+
+
+def order_created_event(order_id: int, user_id: int, total_price: int) -> OutboxEvent:
+    """Событие order.created для записи в той же транзакции, что и заказ"""
+    return OutboxEvent(
+        routing_key="order.created",
+        payload=json.dumps(order_created_payload(order_id, user_id, total_price)),
+    )
+
+
+class OutboxRelay:
+    """
+    Фоновая задача: забирает события из outbox пачками
+    (SELECT ... FOR UPDATE SKIP LOCKED — реплики не мешают друг другу),
+    публикует их с подтверждениями и удаляет опубликованные
+    """
+
+    def __init__(
+        self,
+        publisher: ConfirmedPublisher,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = 100,
+        poll_interval: float = 0.5,
+    ):
+        self.publisher = publisher
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._task = None
+        self._wakeup = asyncio.Event()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Outbox relay запущен")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self):
+        """Будит relay сразу после записи события в этой реплике"""
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                relayed = await self.relay_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка outbox relay: {e}")
+                relayed = 0
+
+            # Полная пачка — сразу за следующей, иначе ждем новых событий
+            if relayed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    @staticmethod
+    def _encode(payload: str) -> tuple[bytes, str]:
+        # В outbox payload хранится в JSON, в другой формат перекодируем при отправке
+        if MESSAGE_FORMAT == "json":
+            return payload.encode("utf-8"), CONTENT_TYPE_JSON
+        return encode_message(json.loads(payload))
+
+    async def relay_batch(self) -> int:
+        async with self.session_factory() as session:
+            async with session.begin():
+                result = await session.execute(
+                    select(OutboxEvent.id, OutboxEvent.routing_key, OutboxEvent.payload)
+                    .order_by(OutboxEvent.id)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)
+                )
+                events = result.all()
+                if not events:
+                    return 0
+
+                results = await asyncio.gather(
+                    *(
+                        self.publisher.publish(
+                            *self._encode(event.payload), routing_key=event.routing_key
+                        )
+                        for event in events
+                    ),
+                    return_exceptions=True,
+                )
+
+                # Удаляем только подтвержденные брокером, остальные уйдут в следующей пачке
+                published_ids = [
+                    event.id
+                    for event, result in zip(events, results)
+                    if not isinstance(result, BaseException)
+                ]
+                if published_ids:
+                    await session.execute(
+                        delete(OutboxEvent).where(OutboxEvent.id.in_(published_ids))
+                    )
+
+                failed = len(events) - len(published_ids)
+                if failed:
+                    logger.error(f"Outbox: не опубликовано {failed} событий, повторим")
+
+        return len(published_ids)
+
+
+outbox_relay = OutboxRelay(
+    order_publisher,
+    batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", "100")),
+    poll_interval=float(os.getenv("OUTBOX_POLL_INTERVAL", "0.5")),
+)
@@ -0,0 +1,346 @@
+import asyncio
+import os
+
+import asyncpg
+from app.db import AsyncSessionLocal, engine
+from app.logger import logger
+from app.models import Product
+from app.redis import RedisCache, redis_cache
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# Синхронизация цен Postgres -> Redis: notify (LISTEN/NOTIFY + сверка) | off
+PRICE_SYNC_MODE = os.getenv("PRICE_SYNC_MODE", "notify")
+
+PRODUCT_CHANGES_CHANNEL = "product_changes"
+# Ключи advisory lock: ведущая реплика держит свой на сессии все время работы,
+# DDL при старте — на транзакции. Ключи разные: блокировки одного ключа
+# конфликтуют, и старт воркеров ждал бы ведущую реплику бесконечно
+PRICE_SYNC_LEADER_LOCK_ID = 7_301_001
+PRICE_SYNC_DDL_LOCK_ID = 7_301_002
+
+# Колонка version нужна модели Product в любом режиме: INSERT ... RETURNING
+# и предзагрузка читают ее. Таблицу могли создать без нее (parser, монолит)
+PRODUCT_VERSION_COLUMN_DDL = (
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT 0"
+)
+PRODUCT_VERSION_INDEX_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_products_version ON products (version)"
+)
+
+# Версия товара из последовательности при каждом insert/update name или price;
+# после commit — NOTIFY с id товара (одинаковые уведомления транзакции Postgres
+# схлопывает). Только в режиме notify
+PRICE_SYNC_DDL = (
+    "CREATE SEQUENCE IF NOT EXISTS products_version_seq",
+    """
+    CREATE OR REPLACE FUNCTION products_bump_version() RETURNS trigger AS $$
+    BEGIN
+        NEW.version := nextval('products_version_seq');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION products_notify_change() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            PERFORM pg_notify('{PRODUCT_CHANGES_CHANNEL}', OLD.id::text);
+        ELSE
+            PERFORM pg_notify('{PRODUCT_CHANGES_CHANNEL}', NEW.id::text);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER products_version
+    BEFORE INSERT OR UPDATE OF name, price ON products
+    FOR EACH ROW EXECUTE FUNCTION products_bump_version()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER products_notify
+    AFTER INSERT OR UPDATE OF name, price OR DELETE ON products
+    FOR EACH ROW EXECUTE FUNCTION products_notify_change()
+    """,
+)
+
+
+# Что из DDL уже есть. Проверка по каталогу без блокировок: ALTER TABLE берет
+# ACCESS EXCLUSIVE на products до проверки IF NOT EXISTS и ждал бы долгих
+# чтений (потоковой предзагрузки другой реплики), а чтения товаров — его
+PRICE_SYNC_STATE_SQL = """
+SELECT
+    EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema()
+            AND table_name = 'products' AND column_name = 'version'
+    ) AS has_column,
+    to_regclass('ix_products_version') IS NOT NULL AS has_index,
+    (
+        SELECT count(*) FROM pg_trigger
+        WHERE tgrelid = to_regclass('products')
+            AND tgname IN ('products_version', 'products_notify')
+    ) = 2 AS has_triggers
+"""
+
+
+async def _missing_price_sync_ddl(conn: AsyncConnection, notify: bool) -> list[str]:
+    result = await conn.exec_driver_sql(PRICE_SYNC_STATE_SQL)
+    state = result.one()
+    statements = []
+    if not state.has_column:
+        statements.append(PRODUCT_VERSION_COLUMN_DDL)
+    if not state.has_index:
+        statements.append(PRODUCT_VERSION_INDEX_DDL)
+    if notify and not state.has_triggers:
+        statements.extend(PRICE_SYNC_DDL)
+    return statements
+
+
+async def install_price_sync(conn: AsyncConnection, notify: bool = True):
+    """Колонка version, в режиме notify — последовательность и триггеры (PostgreSQL)"""
+    # Обычно все уже установлено: старт не берет блокировок на products
+    if not await _missing_price_sync_ddl(conn, notify):
+        return
+
+    # Воркеры стартуют одновременно: DDL выполняет один, остальные ждут
+    # и после блокировки проверяют заново
+    await conn.exec_driver_sql(
+        f"SELECT pg_advisory_xact_lock({PRICE_SYNC_DDL_LOCK_ID})"
+    )
+    statements = await _missing_price_sync_ddl(conn, notify)
+    for statement in statements:
+        await conn.exec_driver_sql(statement)
+    if statements:
+        logger.info(f"Синхронизация цен: DDL применено (команд: {len(statements)})")
+
+
+class PriceSync:
+    """
+    Фоновая задача: изменения товаров из Postgres в Redis без полной перезагрузки.
+
+    Одна реплика (pg_try_advisory_lock на своем соединении — при падении
+    освобождается сам) слушает product_changes, копит id и раз в max_delay
+    (или по batch_size) перечитывает их из БД и пишет в Redis одним pipeline.
+    Раз в reconcile_interval — сверка: товары с version больше водяного знака
+    (с запасом overlap на транзакции, завершившиеся не по порядку версий),
+    в Redis пишутся только отличающиеся. Она же догоняет уведомления,
+    пропущенные при переподключении или смене ведущей реплики.
+    """
+
+    def __init__(
+        self,
+        cache: RedisCache,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = 500,
+        max_delay: float = 0.05,
+        reconcile_interval: float = 60,
+        overlap: int = 1000,
+        standby_interval: float = 5,
+    ):
+        self.cache = cache
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.reconcile_interval = reconcile_interval
+        self.overlap = overlap
+        self.standby_interval = standby_interval
+        self._task = None
+        self._pending: set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._connection_lost = False
+
+        self.is_leader = False
+        self.notifications = 0
+        self.batches = 0
+        self.applied = 0
+        self.removed = 0
+        self.reconciliations = 0
+        self.reconciled = 0
+
+    async def start(self):
+        if engine.dialect.name != "postgresql":
+            logger.warning("Синхронизация цен работает только с PostgreSQL, отключена")
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Синхронизация цен запущена")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self._lead()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации цен: {e}")
+            finally:
+                self.is_leader = False
+
+            # Ведет другая реплика или соединение потеряно — пробуем позже
+            await asyncio.sleep(self.standby_interval)
+
+    async def _lead(self):
+        dsn = engine.url.set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+        connection = await asyncpg.connect(dsn)
+        try:
+            if not await connection.fetchval(
+                "SELECT pg_try_advisory_lock($1)", PRICE_SYNC_LEADER_LOCK_ID
+            ):
+                return
+
+            self.is_leader = True
+            self._connection_lost = False
+            connection.add_termination_listener(self._on_connection_lost)
+            await connection.add_listener(PRODUCT_CHANGES_CHANNEL, self._on_notify)
+            logger.info("Синхронизация цен: реплика ведущая, слушаем product_changes")
+
+            # Изменения до подписки догоняет сверка
+            loop = asyncio.get_running_loop()
+            await self.reconcile()
+            next_reconcile = loop.time() + self.reconcile_interval
+
+            while not self._connection_lost:
+                if not self._pending:
+                    try:
+                        await asyncio.wait_for(
+                            self._wakeup.wait(), next_reconcile - loop.time()
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wakeup.clear()
+
+                if self._pending:
+                    # Неполная пачка ждет max_delay: серия изменений — один pipeline
+                    if len(self._pending) < self.batch_size:
+                        await asyncio.sleep(self.max_delay)
+                    await self.flush()
+
+                if loop.time() >= next_reconcile:
+                    await self.reconcile()
+                    next_reconcile = loop.time() + self.reconcile_interval
+
+            logger.warning("Синхронизация цен: соединение LISTEN потеряно")
+        finally:
+            # Закрытие соединения снимает advisory lock
+            await connection.close()
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str):
+        self._pending.add(int(payload))
+        self.notifications += 1
+        self._wakeup.set()
+
+    def _on_connection_lost(self, connection):
+        self._connection_lost = True
+        self._wakeup.set()
+
+    async def flush(self):
+        """Применяет накопленные изменения пачками по batch_size"""
+        while self._pending:
+            ids = [
+                self._pending.pop()
+                for _ in range(min(self.batch_size, len(self._pending)))
+            ]
+            try:
+                # Текущее состояние из БД: порядок уведомлений не важен
+                async with self.session_factory() as session:
+                    result = await session.execute(
+                        select(Product.id, Product.name, Product.price).where(
+                            Product.id.in_(ids)
+                        )
+                    )
+                    products = {
+                        row.id: {"name": row.name, "price": row.price} for row in result
+                    }
+                removed = [
+                    product_id for product_id in ids if product_id not in products
+                ]
+                await self.cache.apply_product_changes(products, removed)
+            except Exception:
+                # Не потерять изменения: вернутся в следующую пачку
+                self._pending.update(ids)
+                raise
+
+            self.batches += 1
+            self.applied += len(products)
+            self.removed += len(removed)
+
+    async def reconcile(self):
+        """Сверка товаров с version больше водяного знака, без полной перезагрузки"""
+        watermark = await self.cache.get_price_sync_watermark()
+        # Водяного знака нет (Redis очищен, предзагрузки не было) — полный проход.
+        # Иначе version > floor: товары с version 0 (до установки триггера)
+        # загрузила предзагрузка
+        floor = -1 if watermark is None else max(watermark - self.overlap, 0)
+        # Keyset по (version, id): у многих товаров version совпадает
+        after = (floor + 1, 0)
+        max_version = watermark or 0
+        changed = 0
+
+        while True:
+            async with self.session_factory() as session:
+                result = await session.execute(
+                    select(Product.id, Product.name, Product.price, Product.version)
+                    .where(tuple_(Product.version, Product.id) > after)
+                    .order_by(Product.version, Product.id)
+                    .limit(self.batch_size)
+                )
+                rows = result.all()
+            if not rows:
+                break
+
+            # В Redis пишутся только отличающиеся товары
+            cached = await self.cache.get_products_bulk([row.id for row in rows])
+            products = {
+                row.id: {"name": row.name, "price": row.price}
+                for row in rows
+                if cached.get(row.id) != {"name": row.name, "price": row.price}
+            }
+            await self.cache.apply_product_changes(products)
+            changed += len(products)
+
+            after = (rows[-1].version, rows[-1].id)
+            max_version = max(max_version, rows[-1].version)
+            if len(rows) < self.batch_size:
+                break
+
+        await self.cache.set_price_sync_watermark(max_version)
+        self.reconciliations += 1
+        self.reconciled += changed
+        if changed:
+            logger.info(
+                f"Сверка цен: обновлено {changed} товаров, версия {max_version}"
+            )
+
+    def stats(self) -> dict:
+        return {
+            "mode": PRICE_SYNC_MODE,
+            "leader": self.is_leader,
+            "pending": len(self._pending),
+            "notifications": self.notifications,
+            "batches": self.batches,
+            "applied": self.applied,
+            "removed": self.removed,
+            "reconciliations": self.reconciliations,
+            "reconciled": self.reconciled,
+        }
+
+
+price_sync = PriceSync(
+    redis_cache,
+    batch_size=int(os.getenv("PRICE_SYNC_BATCH_SIZE", "500")),
+    max_delay=float(os.getenv("PRICE_SYNC_MAX_DELAY_MS", "50")) / 1000,
+    reconcile_interval=float(os.getenv("PRICE_SYNC_RECONCILE_INTERVAL", "60")),
+)
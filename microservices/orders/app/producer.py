@@ -1,23 +1,156 @@
-import json
+import asyncio
+import os
+import time
+
 import aio_pika
 from app.logger import logger
 from app.rabbit import RabbitMQConnection
+from app.serialization import CONTENT_TYPE_JSON, encode_message
 
 
-async def publish_order(order: dict, rabbit_connection: RabbitMQConnection):
-    try:
-        message_body = bytes(json.dumps(order), encoding="utf-8")
+class ConfirmedPublisher:
+    """
+    Публикация с подтверждениями брокера (publisher confirms) через пул каналов
+    RabbitMQConnection. Сообщения не ждут подтверждения в месте вызова:
+    одновременно в полете до max_in_flight публикаций, подтверждения ожидаются
+    в фоновых задачах, при nack/ошибке публикация повторяется.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 1000,
+        max_retries: int = 3,
+        retry_delay: float = 0.1,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.rabbit_connection = None
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: set[asyncio.Task] = set()
+
+        self.published = 0
+        self.confirmed = 0
+        self.nacked = 0
+        self.retries = 0
+        self.failed = 0
+        self.confirm_latency_total = 0.0
+        self.confirm_latency_max = 0.0
+
+    async def start(self, rabbit_connection: RabbitMQConnection):
+        await rabbit_connection.connect()
+        self.rabbit_connection = rabbit_connection
+
+    async def stop(self):
+        """Дожидается подтверждений уже отправленных сообщений"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.rabbit_connection = None
+
+    async def submit(
+        self, body: bytes, routing_key: str, content_type: str = CONTENT_TYPE_JSON
+    ):
+        """
+        Передает сообщение в конвейер публикации и сразу возвращает управление.
+        Ждет только если в полете уже max_in_flight сообщений (backpressure).
+        """
+        await self._slots.acquire()
+        task = asyncio.create_task(self._publish(body, routing_key, content_type))
+        self._tasks.add(task)
+        task.add_done_callback(self._on_publish_done)
+
+    def _on_publish_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        self._slots.release()
+
+    async def _publish(self, body: bytes, routing_key: str, content_type: str):
+        try:
+            await self.publish(body, routing_key, content_type)
+        except Exception as e:
+            logger.error(
+                f"Сообщение {routing_key} не подтверждено брокером "
+                f"после {self.max_retries + 1} попыток: {e}"
+            )
+
+    async def publish(
+        self, body: bytes, routing_key: str, content_type: str = CONTENT_TYPE_JSON
+    ):
+        """Публикует сообщение и ждет подтверждения брокера, с повторами при nack"""
         message = aio_pika.Message(
-            body=message_body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+            body=body,
+            content_type=content_type,
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
         )
+        self.published += 1
+
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                if self.rabbit_connection is None:
+                    raise RuntimeError("RabbitMQ exchange не инициализирован")
+
+                exchange = await self.rabbit_connection.get_exchange()
+                await exchange.publish(message, routing_key=routing_key)
+            except Exception as e:
+                if isinstance(e, aio_pika.exceptions.DeliveryError):
+                    self.nacked += 1
+
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    raise
 
-        if rabbit_connection.exchange is None:
+                self.retries += 1
+                await asyncio.sleep(self.retry_delay * 2**attempt)
+                continue
+
+            latency = time.perf_counter() - start
+            self.confirmed += 1
+            self.confirm_latency_total += latency
+            self.confirm_latency_max = max(self.confirm_latency_max, latency)
+            return
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._tasks),
+            "max_in_flight": self.max_in_flight,
+            "published": self.published,
+            "confirmed": self.confirmed,
+            "nacked": self.nacked,
+            "retries": self.retries,
+            "failed": self.failed,
+            "confirm_latency_avg": (
+                round(self.confirm_latency_total / self.confirmed, 6)
+                if self.confirmed
+                else 0.0
+            ),
+            "confirm_latency_max": round(self.confirm_latency_max, 6),
+        }
+
+
+# Запись на каждое сообщение — отдельный логгер для сэмплирования (LOG_SAMPLING)
+publish_logger = logger.getChild("publish")
+
+order_publisher = ConfirmedPublisher(
+    max_in_flight=int(os.getenv("PUBLISH_MAX_IN_FLIGHT", "1000")),
+)
+
+
+async def publish_order(order: dict, rabbit_connection: RabbitMQConnection):
+    try:
+        message_body, content_type = encode_message(order)
+
+        if order_publisher.rabbit_connection is None:
             logger.error("RabbitMQ exchange не инициализирован")
             return
 
-        await rabbit_connection.exchange.publish(message, routing_key="order.created")
+        await order_publisher.submit(
+            message_body, routing_key="order.created", content_type=content_type
+        )
 
-        logger.info(f"Публикация сообщения order.created: {order}")
+        publish_logger.info(
+            "Публикация сообщения order.created",
+            extra={"order_id": order["order_id"], "user_id": order["user_id"]},
+        )
 
     except Exception as e:
         logger.error(f"Ошибка при публикации сообщения в RabbitMQ: {e}")
@@ -1,33 +1,85 @@
+import asyncio
 import aio_pika
 import os
 from contextlib import asynccontextmanager
 from app.logger import logger
 
 RABBITMQ_URL = os.getenv("RABBITMQ_URL")
+RABBITMQ_CHANNEL_POOL_SIZE = int(os.getenv("RABBITMQ_CHANNEL_POOL_SIZE", "8"))
 
 
 class RabbitMQConnection:
-    def __init__(self):
+    """
+    Соединение с RabbitMQ: основной канал (объявления, потребление) и пул
+    каналов для публикации. Публикации распределяются по каналам пула по кругу,
+    закрытые каналы пересоздаются при выдаче.
+    """
+
+    def __init__(self, pool_size: int = RABBITMQ_CHANNEL_POOL_SIZE):
+        self.pool_size = max(pool_size, 1)
         self.connection = None
         self.channel = None
         self.exchange = None
+        self._pool: list[tuple] = []
+        self._next = 0
+        self._lock = asyncio.Lock()
 
     async def connect(self):
-        if not self.connection:
+        if self.connection and not self.connection.is_closed:
+            return self
+
+        async with self._lock:
+            if self.connection and not self.connection.is_closed:
+                return self
+
+            # Прежнее соединение и его каналы закрываем, а не бросаем
+            await self.close()
             self.connection = await aio_pika.connect_robust(RABBITMQ_URL)
-            self.channel = await self.connection.channel()
-            self.exchange = await self.channel.declare_exchange(
-                "marketplace", aio_pika.ExchangeType.DIRECT, durable=True
+            try:
+                self.channel, self.exchange = await self._open_channel()
+                self._pool = [await self._open_channel() for _ in range(self.pool_size)]
+            except Exception:
+                # Без пула соединение не считается установленным
+                await self.close()
+                raise
+            logger.info(
+                "Соединение с RabbitMQ установлено "
+                f"(каналов публикации: {self.pool_size})"
             )
-            logger.info("Соединение с RabbitMQ установлено")
         return self
 
+    async def _open_channel(self) -> tuple:
+        channel = await self.connection.channel(publisher_confirms=True)
+        exchange = await channel.declare_exchange(
+            "marketplace", aio_pika.ExchangeType.DIRECT, durable=True
+        )
+        return channel, exchange
+
+    async def get_exchange(self) -> aio_pika.abc.AbstractExchange:
+        """Exchange на следующем канале пула (round-robin) с проверкой живости канала"""
+        await self.connect()
+
+        index = self._next % self.pool_size
+        self._next = index + 1
+        channel, exchange = self._pool[index]
+
+        if channel.is_closed:
+            async with self._lock:
+                channel, exchange = self._pool[index]
+                if channel.is_closed:
+                    logger.warning(f"Канал публикации №{index} закрыт, пересоздаем")
+                    channel, exchange = await self._open_channel()
+                    self._pool[index] = (channel, exchange)
+
+        return exchange
+
     async def close(self):
         if self.connection:
             await self.connection.close()
             self.connection = None
             self.channel = None
             self.exchange = None
+            self._pool = []
             logger.info("Соединение с RabbitMQ закрыто")
 
 
@@ -1,12 +1,112 @@
 import json
 import os
 import asyncio
+import time
+import uuid
 from contextlib import asynccontextmanager
 
+import orjson
 import redis.asyncio as redis
 from app.logger import logger
+from app.metrics import PRICE_PRELOAD_SECONDS, REDIS_COMMAND_SECONDS
 from app.models import Product
-from sqlalchemy import select
+from app.ttl_cache import TTLCache
+from sqlalchemy import Integer, any_, bindparam, func, select
+from redis.asyncio.client import Pipeline
+from sqlalchemy.dialects.postgresql import ARRAY
+
+# Продление и снятие блокировки предзагрузки только владельцем: сравнение
+# токена и команда выполняются атомарно
+EXTEND_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlightAborted(Exception):
+    """Загружающий запрос отменен: ожидающие его результата загружают сами"""
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        with REDIS_COMMAND_SECONDS.labels("PIPELINE").time():
+            return await super().execute(raise_on_error)
+
+
+class InstrumentedRedis(redis.Redis):
+    """Клиент Redis с гистограммой длительности каждой команды"""
+
+    async def execute_command(self, *args, **options):
+        with REDIS_COMMAND_SECONDS.labels(str(args[0]).upper()).time():
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> Pipeline:
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+class LocalPriceCache(TTLCache):
+    """In-process кэш цен (L1): product_id -> цена"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60):
+        super().__init__(max_size, ttl)
+        # Растет с каждой инвалидацией: заполнение, начатое до нее, не сохраняется
+        self.generation = 0
+        self.stale_fills = 0
+
+    def set_many(self, price_dict: dict[int, float], generation: int | None = None):
+        """
+        generation — значение self.generation до чтения цен из Redis или БД:
+        если с тех пор была инвалидация, прочитанные цены могли устареть
+        """
+        if generation is not None and generation != self.generation:
+            self.stale_fills += 1
+            return
+        super().set_many(price_dict)
+
+    def invalidate(self, product_ids: list[int] | None = None):
+        """Удаляет указанные id из L1, без аргументов — очищает кэш целиком"""
+        self.generation += 1
+        if product_ids is None:
+            self.clear()
+            return
+        self.delete(product_ids)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "stale_fills": self.stale_fills}
+
+
+class EndpointHitStats:
+    """Откуда отдан ответ эндпоинта: local (кэш ответов), redis, negative, db"""
+
+    sources = ("local", "redis", "negative", "db")
+
+    def __init__(self):
+        self._counts: dict[str, dict[str, int]] = {}
+
+    def record(self, endpoint: str, source: str):
+        counts = self._counts.setdefault(endpoint, dict.fromkeys(self.sources, 0))
+        counts[source] += 1
+
+    def stats(self) -> dict:
+        result = {}
+        for endpoint, counts in self._counts.items():
+            requests = sum(counts.values())
+            result[endpoint] = {
+                **counts,
+                "requests": requests,
+                "hit_ratio": round(1 - counts["db"] / requests, 4),
+            }
+        return result
 
 
 class RedisCache:
@@ -15,130 +115,543 @@ class RedisCache:
         self.client = None
         self.preload_lock_key = "preload_prices_lock"
         self.preload_complete_key = "preload_prices_complete"
+        # Канал событий предзагрузки: done / released — вместо опроса блокировки
+        self.preload_channel = "preload_prices_events"
+        self.preload_lock_ttl_ms = 30000
+        self.preload_ttl = 86400  # 24 часа
+        self.preload_chunk_size = int(os.getenv("PRELOAD_CHUNK_SIZE", "5000"))
+        # Последняя версия товара, учтенная в Redis (app/price_sync.py), без TTL
+        self.price_sync_watermark_key = "price_sync_watermark"
+        # pending -> running -> loaded | skipped | waited | empty | timeout | failed
+        self.preload_state = "pending"
+        self.preload_seconds = None
+        self.invalidation_channel = "product_price_invalidate"
+        # Версия каталога входит в ключи страниц: изменение каталога — один INCR,
+        # старые страницы не удаляются, а истекают по TTL
+        self.catalog_version_key = "catalog_version"
+        self.catalog_ttl = int(os.getenv("CATALOG_CACHE_TTL", "300"))
+        # Сколько помнить, что товара нет (защита БД от потока 404)
+        self.catalog_negative_ttl = int(os.getenv("CATALOG_NEGATIVE_TTL", "30"))
+        self.catalog_stats = EndpointHitStats()
+        # Порог, после которого вместо списка id рассылается сброс всего L1
+        self.invalidate_all_threshold = 1000
+        self.local = LocalPriceCache(
+            max_size=int(os.getenv("PRICE_L1_MAX_SIZE", "10000")),
+            ttl=float(os.getenv("PRICE_L1_TTL", "60")),
+        )
+        self._invalidation_task = None
+        # Дополнительные обработчики инвалидации (кэш ответов): callback(ids | None)
+        self._invalidation_listeners = []
+        # Загрузки из БД, выполняющиеся прямо сейчас: product_id -> Future с ценой
+        self._inflight: dict[int, asyncio.Future] = {}
 
     async def connect(self):
-        self.client = redis.from_url(
+        self.client = InstrumentedRedis.from_url(
             self.redis_url, encoding="utf-8", decode_responses=True
         )
+        if self._invalidation_task is None:
+            self._invalidation_task = asyncio.create_task(self._listen_invalidations())
 
     async def disconnect(self):
+        if self._invalidation_task:
+            self._invalidation_task.cancel()
+            try:
+                await self._invalidation_task
+            except asyncio.CancelledError:
+                pass
+            self._invalidation_task = None
+
         if self.client:
             await self.client.close()
 
-    async def get_product_price(self, product_id: int) -> float | None:
-        if not self.client:
-            return None
+    async def _listen_invalidations(self):
+        """Слушает канал инвалидации и сбрасывает L1 по сообщениям других реплик"""
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.invalidation_channel)
+                # Пока не были подписаны, могли пропустить инвалидации
+                self._apply_invalidation("*")
+
+                async for message in pubsub.listen():
+                    self._apply_invalidation(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка подписки на инвалидацию цен: {e}")
+                self._apply_invalidation("*")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def add_invalidation_listener(self, callback):
+        self._invalidation_listeners.append(callback)
+
+    def _apply_invalidation(self, data: str):
+        product_ids = None if data == "*" else [int(pid) for pid in json.loads(data)]
+
+        self.local.invalidate(product_ids)
+        for callback in self._invalidation_listeners:
+            callback(product_ids)
+
+    async def _publish_invalidation(self, product_ids: list[int]):
+        if len(product_ids) > self.invalidate_all_threshold:
+            data = "*"
+        else:
+            data = json.dumps(product_ids)
+
+        self._apply_invalidation(data)
+        await self.client.publish(self.invalidation_channel, data)
 
-        price = await self.client.get(f"product_price:{product_id}")
-        return float(price) if price else None
+    async def get_product_price(self, product_id: int) -> float | None:
+        prices = await self.get_product_prices_bulk([product_id])
+        return prices.get(product_id)
 
     async def set_product_price(
         self, product_id: int, price: float, expire: int = 3600
     ):
         if self.client:
             await self.client.setex(f"product_price:{product_id}", expire, str(price))
+            await self._publish_invalidation([product_id])
 
     async def get_product_prices_bulk(self, product_ids: list[int]) -> dict[int, float]:
         if not self.client:
             return {}
 
-        keys = [f"product_price:{pid}" for pid in product_ids]
+        result, missing = self.local.get_many(product_ids)
+        if not missing:
+            return result
+
+        # Инвалидация во время MGET: ответ может содержать старую цену
+        generation = self.local.generation
+        keys = [f"product_price:{pid}" for pid in missing]
         values = await self.client.mget(keys)
 
-        result = {}
-        for product_id, price in zip(product_ids, values):
+        fetched = {}
+        for product_id, price in zip(missing, values):
             if price is not None:
-                result[product_id] = float(price)
+                fetched[product_id] = float(price)
 
+        self.local.set_many(fetched, generation)
+        result.update(fetched)
         return result
 
+    async def get_product_prices_read_through(
+        self, product_ids: list[int], db_session
+    ) -> dict[int, float]:
+        """Цены из кэша, недостающие — из БД с последующим заполнением Redis"""
+        result = await self.get_product_prices_bulk(product_ids)
+
+        missing = set(product_ids) - result.keys()
+        if missing:
+            result.update(await self._load_missing_prices(missing, db_session))
+
+        return result
+
+    async def _load_missing_prices(
+        self, product_ids: set[int], db_session
+    ) -> dict[int, float]:
+        """Single-flight загрузка: одновременные промахи по одному id ждут один запрос"""
+        loop = asyncio.get_running_loop()
+        waiting = {}
+        to_load = []
+
+        for product_id in product_ids:
+            future = self._inflight.get(product_id)
+            if future is None:
+                future = loop.create_future()
+                self._inflight[product_id] = future
+                to_load.append(product_id)
+            waiting[product_id] = future
+
+        if to_load:
+            generation = self.local.generation
+            try:
+                ids = bindparam("ids", to_load, type_=ARRAY(Integer))
+                stmt = select(Product.id, Product.price).where(Product.id == any_(ids))
+                result = await db_session.execute(stmt)
+                loaded = {row.id: float(row.price) for row in result.all()}
+
+                if loaded:
+                    await self._write_prices(loaded, expire=3600)
+                    self.local.set_many(loaded, generation)
+                    logger.info(f"Дозагружены цены из БД в кэш: {list(loaded)}")
+
+                for product_id in to_load:
+                    self._inflight.pop(product_id).set_result(loaded.get(product_id))
+            except asyncio.CancelledError:
+                # Отменен только этот запрос (клиент отключился, таймаут):
+                # future не отменяем, иначе CancelledError получат чужие запросы
+                for product_id in to_load:
+                    future = self._inflight.pop(product_id)
+                    future.set_exception(SingleFlightAborted())
+                    future.exception()
+                raise
+            except Exception as e:
+                for product_id in to_load:
+                    future = self._inflight.pop(product_id)
+                    future.set_exception(e)
+                    # Исключение пробрасывается ниже; помечаем его полученным,
+                    # чтобы не было предупреждения, если других ожидающих нет
+                    future.exception()
+                raise
+
+        prices = {}
+        aborted = set()
+        for product_id, future in waiting.items():
+            try:
+                price = await asyncio.shield(future)
+            except SingleFlightAborted:
+                aborted.add(product_id)
+                continue
+            if price is not None:
+                prices[product_id] = price
+
+        if aborted:
+            # Один из ожидающих станет новым загружающим
+            prices.update(await self._load_missing_prices(aborted, db_session))
+        return prices
+
+    async def _write_prices(self, price_dict: dict[int, float], expire: int):
+        pipeline = self.client.pipeline()
+        for product_id, price in price_dict.items():
+            pipeline.setex(f"product_price:{product_id}", expire, str(price))
+        await pipeline.execute()
+
     async def set_product_prices_bulk(
         self, price_dict: dict[int, float], expire: int = 3600
     ):
         if not self.client:
             return
 
+        await self._write_prices(price_dict, expire)
+        await self._publish_invalidation(list(price_dict))
+
+    def get_stats(self) -> dict:
+        """Счетчики попаданий/промахов/вытеснений L1"""
+        return self.local.stats()
+
+    async def get_products_bulk(self, product_ids: list[int]) -> dict[int, dict]:
+        """Карточки товаров {name, price} одним MGET"""
+        if not self.client or not product_ids:
+            return {}
+
+        keys = [f"product_info:{pid}" for pid in product_ids]
+        values = await self.client.mget(keys)
+
+        products = {}
+        for product_id, value in zip(product_ids, values):
+            # "null" — отрицательная запись: товара нет в БД
+            if value is not None and value != "null":
+                products[product_id] = json.loads(value)
+        return products
+
+    @staticmethod
+    def _encode_product(product: dict) -> str:
+        return json.dumps(product, ensure_ascii=False, separators=(",", ":"))
+
+    async def set_products_bulk(self, products: dict[int, dict], expire: int = 3600):
+        if not self.client:
+            return
+
         pipeline = self.client.pipeline()
-        for product_id, price in price_dict.items():
-            pipeline.setex(f"product_price:{product_id}", expire, str(price))
+        for product_id, product in products.items():
+            pipeline.setex(
+                f"product_info:{product_id}", expire, self._encode_product(product)
+            )
         await pipeline.execute()
 
-    async def preload_all_prices(self, db_session):
-        """Предзагружаем все цены товаров в Redis с блокировкой"""
-        # Проверяем, не была ли уже выполнена предзагрузка
-        if await self.client.get(self.preload_complete_key):
-            logger.info("Предзагрузка уже выполнена ранее, пропускаем")
-            return
+    async def get_products_read_through(
+        self, product_ids: list[int], db_session
+    ) -> dict[int, dict]:
+        """Карточки товаров из кэша, недостающие — из БД с заполнением Redis"""
+        result = await self.get_products_bulk(product_ids)
+
+        missing = list(set(product_ids) - result.keys())
+        if missing:
+            ids = bindparam("ids", missing, type_=ARRAY(Integer))
+            rows = await db_session.execute(
+                select(Product.id, Product.name, Product.price).where(
+                    Product.id == any_(ids)
+                )
+            )
+            loaded = {
+                row.id: {"name": row.name, "price": row.price} for row in rows.all()
+            }
+            if loaded:
+                await self.set_products_bulk(loaded)
+                result.update(loaded)
 
-        # Пробуем захватить блокировку
-        lock_acquired = await self.client.set(
-            self.preload_lock_key,
-            "1",
-            nx=True,
-            ex=30,  # Блокировка на 30 секунд
-        )
+        return result
 
-        if not lock_acquired:
-            logger.info("Предзагрузка выполняется другим процессом, ждем...")
-            # Ждем пока другой процесс завершит предзагрузку
-            await self._wait_for_preload_completion()
+    async def apply_product_changes(
+        self, products: dict[int, dict], removed: list[int] | None = None
+    ):
+        """
+        Изменения товаров из БД одним pipeline: цены и карточки, удаление
+        отсутствующих, новая версия каталога; затем инвалидация L1 всех реплик
+        """
+        removed = removed or []
+        if not self.client or not (products or removed):
             return
 
-        try:
-            logger.info("Захватили блокировку для предзагрузки цен")
+        pipeline = self.client.pipeline(transaction=False)
+        for product_id, product in products.items():
+            pipeline.setex(
+                f"product_price:{product_id}", self.preload_ttl, str(product["price"])
+            )
+            pipeline.setex(
+                f"product_info:{product_id}",
+                self.preload_ttl,
+                self._encode_product(product),
+            )
+        for product_id in removed:
+            pipeline.delete(f"product_price:{product_id}", f"product_info:{product_id}")
+        pipeline.incr(self.catalog_version_key)
+        await pipeline.execute()
 
-            # Проверяем еще раз на случай если предзагрузка завершилась пока мы ждали блокировку
-            if await self.client.get(self.preload_complete_key):
-                logger.info("Предзагрузка уже выполнена, освобождаем блокировку")
-                return
+        await self._publish_invalidation([*products, *removed])
 
-            # Выполняем предзагрузку
-            result = await db_session.execute(select(Product.id, Product.price))
-            all_prices = {row.id: row.price for row in result.all()}
+    async def get_price_sync_watermark(self) -> int | None:
+        value = await self.client.get(self.price_sync_watermark_key)
+        return int(value) if value is not None else None
 
-            if all_prices:
-                await self.set_product_prices_bulk(all_prices, expire=86400)  # 24 часа
+    async def set_price_sync_watermark(
+        self, version: int, only_if_missing: bool = False
+    ):
+        await self.client.set(
+            self.price_sync_watermark_key, version, nx=only_if_missing
+        )
 
-                # Помечаем что предзагрузка завершена
-                await self.client.setex(self.preload_complete_key, 86400, "1")
-                logger.info(f"Preloaded {len(all_prices)} product prices to Redis")
-            else:
-                logger.warning("No products found for preloading")
+    async def bump_catalog_version(self):
+        """Делает недействительными все закэшированные страницы каталога"""
+        if self.client:
+            await self.client.incr(self.catalog_version_key)
+
+    async def get_catalog_page(self, skip: int, limit: int, db_session) -> bytes:
+        """Страница GET /products (JSON) из Redis, промах — из БД с записью в Redis"""
+        version = await self.client.get(self.catalog_version_key) or "0"
+        key = f"catalog:{version}:products:{skip}:{limit}"
+
+        body = await self.client.get(key)
+        if body is not None:
+            self.catalog_stats.record("GET /products", "redis")
+            return body.encode()
+
+        result = await db_session.execute(
+            select(Product.id, Product.name, Product.price)
+            .order_by(Product.id)
+            .offset(skip)
+            .limit(limit)
+        )
+        body = orjson.dumps([row._asdict() for row in result])
+        # Страница, прочитанная до смены версии, ляжет под старый ключ и не будет видна
+        await self.client.setex(key, self.catalog_ttl, body)
+        self.catalog_stats.record("GET /products", "db")
+        return body
+
+    async def get_catalog_product(self, product_id: int, db_session) -> bytes | None:
+        """
+        Карточка GET /products/{id} (JSON) из product_info, промах — из БД.
+        Отсутствующий товар запоминается на catalog_negative_ttl, возвращается None
+        """
+        key = f"product_info:{product_id}"
+        value = await self.client.get(key)
+        if value == "null":
+            self.catalog_stats.record("GET /products/{id}", "negative")
+            return None
+        if value is not None:
+            self.catalog_stats.record("GET /products/{id}", "redis")
+            return orjson.dumps({"id": product_id, **json.loads(value)})
 
-        except Exception as e:
-            logger.error(f"Ошибка при предзагрузке цен: {e}")
-            # В случае ошибки снимаем блокировку, чтобы другие процессы могли попробовать
-            await self.client.delete(self.preload_lock_key)
+        result = await db_session.execute(
+            select(Product.name, Product.price).where(Product.id == product_id)
+        )
+        row = result.first()
+        self.catalog_stats.record("GET /products/{id}", "db")
+        if row is None:
+            await self.client.setex(key, self.catalog_negative_ttl, "null")
+            return None
+
+        await self.set_products_bulk(
+            {product_id: {"name": row.name, "price": row.price}}
+        )
+        return orjson.dumps({"id": product_id, "name": row.name, "price": row.price})
+
+    async def preload_all_prices(self, db_session, timeout: float = 60):
+        """
+        Предзагрузка цен и карточек всех товаров в Redis при старте. Загружает
+        одна реплика (блокировка), остальные ждут события в канале предзагрузки.
+        """
+        start = time.perf_counter()
+        self.preload_state = "running"
+        try:
+            self.preload_state = await self._preload(db_session, timeout)
+        except Exception:
+            self.preload_state = "failed"
             raise
         finally:
-            # Всегда освобождаем блокировку
-            await self.client.delete(self.preload_lock_key)
-            logger.info("Блокировка предзагрузки освобождена")
-
-    async def _wait_for_preload_completion(self, timeout: int = 30):
-        """Ожидает завершения предзагрузки другим процессом"""
-        start_time = asyncio.get_event_loop().time()
-
-        while asyncio.get_event_loop().time() - start_time < timeout:
-            # Проверяем завершена ли предзагрузка
+            self.preload_seconds = time.perf_counter() - start
+            PRICE_PRELOAD_SECONDS.set(self.preload_seconds)
+            logger.info(
+                f"Предзагрузка цен: {self.preload_state} "
+                f"за {self.preload_seconds:.2f} сек"
+            )
+
+    async def _preload(self, db_session, timeout: float) -> str:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        while True:
+            # Проверяем, не была ли уже выполнена предзагрузка
             if await self.client.get(self.preload_complete_key):
-                logger.info("Предзагрузка завершена другим процессом")
-                return
+                logger.info("Предзагрузка уже выполнена ранее, пропускаем")
+                return "skipped"
+
+            # Значение блокировки — токен процесса: снимаем только свою
+            token = uuid.uuid4().hex
+            if await self.client.set(
+                self.preload_lock_key, token, nx=True, px=self.preload_lock_ttl_ms
+            ):
+                result = await self._load_all_prices(db_session, token)
+                if result is not None:
+                    return result
+                # Блокировка истекла и захвачена другим процессом — ждем его
+                continue
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logger.warning("Таймаут ожидания предзагрузки")
+                return "timeout"
 
-            # Проверяем освобождена ли блокировка (значит что-то пошло не так)
-            if not await self.client.get(self.preload_lock_key):
-                logger.info("Блокировка освобождена, можно попробовать снова")
-                return
+            logger.info("Предзагрузка выполняется другим процессом, ждем...")
+            if await self._wait_for_preload_completion(remaining):
+                logger.info("Предзагрузка завершена другим процессом")
+                return "waited"
+            # Блокировка снята без результата (ошибка или падение загрузчика) —
+            # пробуем загрузить сами
+
+    async def _load_all_prices(self, db_session, token: str) -> str:
+        """
+        Потоковая загрузка товаров пачками: одна пачка — один pipeline.
+        None — блокировка потеряна (истекла и захвачена другим процессом)
+        """
+        logger.info("Захватили блокировку для предзагрузки цен")
+        done = False
+        lost = False
+        try:
+            # Изменения после этой версии догонит сверка синхронизации цен
+            max_version = await db_session.scalar(select(func.max(Product.version)))
+            stmt = (
+                select(Product.id, Product.name, Product.price)
+                .order_by(Product.id)
+                .execution_options(yield_per=self.preload_chunk_size)
+            )
+            result = await db_session.stream(stmt)
+
+            loaded = 0
+            async for rows in result.partitions():
+                pipeline = self.client.pipeline(transaction=False)
+                for row in rows:
+                    pipeline.setex(
+                        f"product_price:{row.id}", self.preload_ttl, str(row.price)
+                    )
+                    pipeline.setex(
+                        f"product_info:{row.id}",
+                        self.preload_ttl,
+                        self._encode_product({"name": row.name, "price": row.price}),
+                    )
+                # Блокировка продлевается с каждой пачкой: время загрузки
+                # большого каталога не ограничено ее TTL
+                pipeline.eval(
+                    EXTEND_LOCK_SCRIPT,
+                    1,
+                    self.preload_lock_key,
+                    token,
+                    self.preload_lock_ttl_ms,
+                )
+                *_, extended = await pipeline.execute()
+                loaded += len(rows)
+                if not extended:
+                    logger.warning(
+                        "Блокировка предзагрузки потеряна, загрузка прервана"
+                    )
+                    lost = True
+                    return None
+
+            if not loaded:
+                logger.warning("No products found for preloading")
+                return "empty"
 
-            # Ждем перед следующей проверкой
-            await asyncio.sleep(1)
+            # Цены изменились целиком: сбрасываем L1 во всех репликах
+            self._apply_invalidation("*")
+            await self.client.publish(self.invalidation_channel, "*")
 
-        logger.warning("Таймаут ожидания предзагрузки")
+            await self.set_price_sync_watermark(max_version or 0, only_if_missing=True)
+            # Помечаем что предзагрузка завершена
+            await self.client.setex(self.preload_complete_key, self.preload_ttl, "1")
+            done = True
+            logger.info(f"Preloaded {loaded} product prices to Redis")
+            return "loaded"
 
-        # Принудительно снимаем блокировку если таймаут
-        if await self.client.get(self.preload_lock_key):
-            logger.warning("Принудительно снимаем блокировку по таймауту")
-            await self.client.delete(self.preload_lock_key)
+        except Exception as e:
+            logger.error(f"Ошибка при предзагрузке цен: {e}")
+            raise
+        finally:
+            # Чужую блокировку не снимаем и ее ожидающих не будим
+            if not lost:
+                await self.client.eval(
+                    RELEASE_LOCK_SCRIPT, 1, self.preload_lock_key, token
+                )
+                # Будим ожидающие процессы: done — готово, released — пробовать самим
+                await self.client.publish(
+                    self.preload_channel, "done" if done else "released"
+                )
+                logger.info("Блокировка предзагрузки освобождена")
+
+    async def _wait_for_preload_completion(self, timeout: float) -> bool:
+        """
+        Ждет события о завершении предзагрузки другим процессом. True — готово,
+        False — блокировка снята без результата или истекло время ожидания
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self.preload_channel)
+
+            while True:
+                # Проверка после подписки: событие могло прийти до нее
+                if await self.client.get(self.preload_complete_key):
+                    return True
+
+                # Ждем события, но не дольше TTL блокировки: упавший
+                # загрузчик не пришлет событие, блокировка просто истечет
+                lock_ttl = await self.client.pttl(self.preload_lock_key)
+                if lock_ttl == -2:
+                    return False
+
+                wait = deadline - loop.time()
+                if lock_ttl > 0:
+                    wait = min(wait, lock_ttl / 1000)
+                if wait <= 0:
+                    return False
+
+                message = await pubsub.get_message(timeout=wait)
+                if message is not None:
+                    return message["data"] == "done"
+        finally:
+            await pubsub.aclose()
+
+    def preload_status(self) -> dict:
+        return {
+            "state": self.preload_state,
+            "seconds": (
+                round(self.preload_seconds, 3)
+                if self.preload_seconds is not None
+                else None
+            ),
+        }
 
     async def reset_preload_status(self):
         """Сброс статуса предзагрузки (для тестирования)"""
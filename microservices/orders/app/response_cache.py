@@ -0,0 +1,32 @@
+import os
+
+from app.ttl_cache import TTLCache
+
+
+class ResponseCache(TTLCache):
+    """
+    In-process кэш готовых тел ответов (bytes) для GET /products и
+    GET /products/{id}. Сбрасывается по инвалидации цен из RedisCache —
+    в том числе от других реплик
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 30):
+        super().__init__(max_size, ttl)
+
+    def invalidate_products(self, product_ids: list[int] | None = None):
+        """
+        Удаляет карточки указанных товаров и все страницы списка
+        (в них могут быть эти товары или новые), без аргументов — все ответы
+        """
+        if product_ids is None:
+            self.clear()
+            return
+
+        self.delete(("product", product_id) for product_id in product_ids)
+        self.delete([key for key in self._data if key[0] == "products"])
+
+
+response_cache = ResponseCache(
+    max_size=int(os.getenv("RESPONSE_CACHE_MAX_SIZE", "1000")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "30")),
+)
@@ -0,0 +1,72 @@
+"""
+Сериализация сообщений RabbitMQ. Формат публикации задается MESSAGE_FORMAT
+(json | msgpack) и передается в заголовке content_type, потребитель выбирает
+декодер по content_type сообщения — во время перехода принимаются оба формата.
+
+Модуль одинаковый в orders и delivery (у сервисов отдельные образы).
+"""
+
+import json
+import os
+
+import msgpack
+
+CONTENT_TYPE_JSON = "application/json"
+CONTENT_TYPE_MSGPACK = "application/msgpack"
+
+# Формат исходящих сообщений. Go-сервисы (ESB) пока понимают только JSON
+MESSAGE_FORMAT = os.getenv("MESSAGE_FORMAT", "json")
+
+
+class Serializer:
+    def __init__(self, content_type: str, dumps, loads):
+        self.content_type = content_type
+        self.dumps = dumps
+        self.loads = loads
+
+
+json_serializer = Serializer(
+    CONTENT_TYPE_JSON,
+    dumps=lambda payload: json.dumps(payload, separators=(",", ":")).encode(),
+    loads=json.loads,
+)
+msgpack_serializer = Serializer(
+    CONTENT_TYPE_MSGPACK,
+    dumps=msgpack.packb,
+    loads=msgpack.unpackb,
+)
+
+serializers = {"json": json_serializer, "msgpack": msgpack_serializer}
+serializers_by_content_type = {
+    CONTENT_TYPE_JSON: json_serializer,
+    CONTENT_TYPE_MSGPACK: msgpack_serializer,
+    # Встречающиеся варианты названия msgpack
+    "application/x-msgpack": msgpack_serializer,
+    "application/vnd.msgpack": msgpack_serializer,
+}
+
+
+def get_serializer(name: str = MESSAGE_FORMAT) -> Serializer:
+    try:
+        return serializers[name]
+    except KeyError:
+        raise ValueError(f"Неизвестный формат сообщений: {name}") from None
+
+
+def encode_message(payload, name: str = MESSAGE_FORMAT) -> tuple[bytes, str]:
+    """Тело сообщения и content_type для публикации"""
+    serializer = get_serializer(name)
+    return serializer.dumps(payload), serializer.content_type
+
+
+def decode_message(body: bytes, content_type: str | None = None):
+    """
+    Декодирует тело по content_type; без content_type (старые публикаторы) — JSON
+    """
+    if not content_type:
+        return json_serializer.loads(body)
+
+    serializer = serializers_by_content_type.get(content_type.split(";")[0].strip())
+    if serializer is None:
+        raise ValueError(f"Неподдерживаемый content_type: {content_type}")
+    return serializer.loads(body)
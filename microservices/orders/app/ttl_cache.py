@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+
+
+class TTLCache:
+    """
+    In-process кэш с TTL записи и вытеснением по размеру (LRU).
+    Основа L1 цен (LocalPriceCache) и кэша ответов (ResponseCache)
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        # Ключ -> (значение, момент истечения по time.monotonic)
+        self._data: OrderedDict[Hashable, tuple[object, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable):
+        found, _ = self.get_many([key])
+        return found.get(key)
+
+    def get_many(self, keys: Iterable[Hashable]) -> tuple[dict, list]:
+        """Возвращает найденные значения и список ключей, которых нет в кэше"""
+        now = time.monotonic()
+        found = {}
+        missing = []
+
+        for key in keys:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > now:
+                self._data.move_to_end(key)
+                found[key] = entry[0]
+                self.hits += 1
+                continue
+
+            if entry is not None:
+                del self._data[key]
+            missing.append(key)
+            self.misses += 1
+
+        return found, missing
+
+    def set(self, key: Hashable, value):
+        self.set_many({key: value})
+
+    def set_many(self, items: dict):
+        if self.max_size <= 0:
+            return
+
+        expires_at = time.monotonic() + self.ttl
+        for key, value in items.items():
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, keys: Iterable[Hashable]):
+        for key in keys:
+            self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,141 @@
+"""
+Бенчмарк памяти GET /orders/export.
+
+Приложение вызывается напрямую через ASGI (без сети), тело ответа читается
+и отбрасывается, каждые --report-every заказов печатается RSS процесса.
+При потоковой выгрузке RSS не должен расти вместе с числом заказов.
+
+Запуск из microservices/orders (DATABASE_URL — тестовая БД PostgreSQL):
+    python -m bench.export_memory --seed 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+
+from app.db import engine
+from app.main import app
+from sqlalchemy import text
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+async def seed(orders: int):
+    """Добавляет заказы (по 2 позиции) средствами PostgreSQL, без передачи строк"""
+    async with engine.begin() as conn:
+        product_id = (await conn.execute(text("SELECT min(id) FROM products"))).scalar()
+        if product_id is None:
+            product_id = (
+                await conn.execute(
+                    text(
+                        "INSERT INTO products (name, price) "
+                        "VALUES ('bench', 1000) RETURNING id"
+                    )
+                )
+            ).scalar_one()
+
+        last_id = (
+            await conn.execute(text("SELECT coalesce(max(id), 0) FROM orders"))
+        ).scalar()
+        await conn.execute(
+            text(
+                "INSERT INTO orders (user_id) "
+                "SELECT g % 500 FROM generate_series(1, :n) AS g"
+            ),
+            {"n": orders},
+        )
+        await conn.execute(
+            text(
+                "INSERT INTO order_items (order_id, product_id, quantity) "
+                "SELECT o.id, :product_id, q FROM orders o, (VALUES (1), (2)) AS v(q) "
+                "WHERE o.id > :last_id"
+            ),
+            {"product_id": product_id, "last_id": last_id},
+        )
+    print(f"Добавлено заказов: {orders}")
+
+
+async def run_export(report_every: int, use_tracemalloc: bool):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/orders/export",
+        "raw_path": b"/orders/export",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "client": ("bench", 0),
+        "server": ("bench", 80),
+    }
+    request_sent = False
+    done = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    stats = {"orders": 0, "bytes": 0, "next_report": report_every}
+    start = time.perf_counter()
+
+    def report():
+        line = (
+            f"{stats['orders']:>10} заказов  {stats['bytes'] / 1024 / 1024:>9.1f} МБ отдано"
+            f"  RSS {rss_mb():>7.1f} МБ"
+        )
+        if use_tracemalloc:
+            current, peak = tracemalloc.get_traced_memory()
+            line += f"  heap {current / 1024 / 1024:>6.1f} МБ (пик {peak / 1024 / 1024:.1f})"
+        print(line + f"  {time.perf_counter() - start:>6.1f} с")
+
+    async def send(message):
+        if message["type"] != "http.response.body":
+            return
+        body = message.get("body", b"")
+        stats["bytes"] += len(body)
+        stats["orders"] += body.count(b"\n")
+        if stats["orders"] >= stats["next_report"]:
+            report()
+            stats["next_report"] += report_every
+        if not message.get("more_body", False):
+            done.set()
+
+    if use_tracemalloc:
+        tracemalloc.start()
+    print(f"RSS до выгрузки: {rss_mb():.1f} МБ")
+    await app(scope, receive, send)
+    report()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Итого: {stats['orders']} заказов, {stats['orders'] / elapsed:.0f} заказов/с"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=0, help="добавить N заказов")
+    parser.add_argument("--report-every", type=int, default=100_000)
+    parser.add_argument("--tracemalloc", action="store_true")
+    args = parser.parse_args()
+
+    if args.seed:
+        await seed(args.seed)
+    await run_export(args.report_every, args.tracemalloc)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""
+Влияние логирования на пропускную способность: запросы/с ASGI-эндпоинта,
+который пишет столько же записей, сколько POST /orders (время записи в БД,
+публикация, общее время), при разных настройках логирования:
+
+- none  — логирование отключено (верхняя граница)
+- sync  — StreamHandler в event loop (прежний basicConfig)
+- queue — QueueHandler/QueueListener из app.logger
+- queue+sampling — то же с сэмплированием orders.publish и orders.timing
+
+Запуск из microservices/orders:
+    python -m bench.logging_overhead --requests 20000 --output /tmp/bench.log
+"""
+
+import argparse
+import asyncio
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+import httpx
+from app.logger import JsonFormatter, LoopQueueHandler, SamplingFilter, logger
+from fastapi import FastAPI
+
+app = FastAPI()
+# Клиент бенчмарка не должен добавлять свои записи на каждый запрос
+logging.getLogger("httpx").setLevel(logging.WARNING)
+timing_logger = logger.getChild("timing")
+publish_logger = logger.getChild("publish")
+
+
+@app.post("/orders")
+async def create_order():
+    start = time.perf_counter()
+    timing_logger.info(f"Запись заказа в БД заняла {0.0012:.4f} сек")
+    publish_logger.info(
+        "Публикация сообщения order.created", extra={"order_id": 1, "user_id": 50}
+    )
+    timing_logger.info(f"Создание заказа заняло {time.perf_counter() - start:.4f} сек")
+    return {"order_id": 1, "user_id": 50, "total_price": 12000, "status": "created"}
+
+
+def configure(mode: str, stream) -> logging.handlers.QueueListener | None:
+    root = logging.getLogger()
+    logging.disable(logging.NOTSET)
+
+    if mode == "none":
+        logging.disable(logging.CRITICAL)
+        return None
+
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+
+    if mode == "sync":
+        root.handlers[:] = [handler]
+        return None
+
+    # Та же схема, что в app.logger, но с записью в поток бенчмарка
+    log_queue = queue.SimpleQueue()
+    queue_handler = LoopQueueHandler(log_queue)
+    if mode == "queue+sampling":
+        queue_handler.addFilter(
+            SamplingFilter({"orders.publish": 0.01, "orders.timing": 0.1})
+        )
+    root.handlers[:] = [queue_handler]
+
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+
+async def run(requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    slots = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def one():
+            async with slots:
+                await client.post("/orders")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument(
+        "--output", default="/tmp/logging_overhead.log", help="файл логов, - — stdout"
+    )
+    args = parser.parse_args()
+
+    stream = sys.stdout if args.output == "-" else open(args.output, "w")
+    results = {}
+    # Прогрев: первый прогон медленнее независимо от режима
+    configure("none", stream)
+    asyncio.run(run(min(args.requests, 2000), args.concurrency))
+    for mode in ("none", "sync", "queue", "queue+sampling"):
+        listener = configure(mode, stream)
+        results[mode] = asyncio.run(run(args.requests, args.concurrency))
+        # Дописываем очередь до следующего режима
+        if listener:
+            listener.stop()
+        print(f"{mode:<16} {results[mode]:>10.0f} запросов/с", file=sys.stderr)
+
+    for mode in ("sync", "queue", "queue+sampling"):
+        print(
+            f"{mode:<16} {results[mode] / results['none'] * 100:>6.1f}% от none",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
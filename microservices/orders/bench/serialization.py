@@ -0,0 +1,69 @@
+"""
+Микробенчмарк форматов сообщений RabbitMQ: стоимость кодирования/декодирования
+и размер тела для типичных сообщений (order.created, delivery.action и заказ
+с позициями).
+
+Запуск из microservices/orders:
+    python -m bench.serialization
+"""
+
+import argparse
+import timeit
+
+from app.serialization import get_serializer, serializers
+
+PAYLOADS = {
+    "order.created": {
+        "order_id": 123456,
+        "user_id": 50,
+        "total_price": 12000,
+        "status": "created",
+    },
+    "delivery.action": {"order_id": 123456, "status": "in_assembly"},
+    "order+items": {
+        "order_id": 123456,
+        "user_id": 50,
+        "total_price": 61500,
+        "status": "created",
+        "items": [
+            {"product_id": 1000 + i, "quantity": i % 3 + 1, "price": 4100 + i * 10}
+            for i in range(10)
+        ],
+    },
+}
+
+
+def measure(name: str, payload: dict, number: int) -> dict:
+    serializer = get_serializer(name)
+    body = serializer.dumps(payload)
+    assert serializer.loads(body) == payload
+
+    encode = timeit.timeit(lambda: serializer.dumps(payload), number=number)
+    decode = timeit.timeit(lambda: serializer.loads(body), number=number)
+    return {
+        "size": len(body),
+        "encode_us": encode / number * 1e6,
+        "decode_us": decode / number * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args()
+
+    print(
+        f"{'сообщение':<16} {'формат':<8} {'байт':>6} "
+        f"{'encode, мкс':>12} {'decode, мкс':>12}"
+    )
+    for message, payload in PAYLOADS.items():
+        for name in serializers:
+            result = measure(name, payload, args.number)
+            print(
+                f"{message:<16} {name:<8} {result['size']:>6} "
+                f"{result['encode_us']:>12.2f} {result['decode_us']:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+import time
+from collections import OrderedDict
+
+from app.logger import logger
+from app.models import Product
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class PriceCache:
+    """
+    In-process кэш цен товаров с TTL и вытеснением по размеру (LRU).
+    Промахи дочитываются из БД одним запросом IN — аналог Redis-кэша цен orders
+    """
+
+    def __init__(self, max_size: int = 100000, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[int, tuple[int, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, product_ids: list[int]) -> tuple[dict[int, int], list[int]]:
+        """Возвращает найденные цены и список id, которых нет в кэше"""
+        now = time.monotonic()
+        found = {}
+        missing = []
+
+        for product_id in product_ids:
+            entry = self._data.get(product_id)
+            if entry is not None and entry[1] > now:
+                self._data.move_to_end(product_id)
+                found[product_id] = entry[0]
+                self.hits += 1
+                continue
+
+            if entry is not None:
+                del self._data[product_id]
+            missing.append(product_id)
+            self.misses += 1
+
+        return found, missing
+
+    def set_many(self, prices: dict[int, int]):
+        if self.max_size <= 0:
+            return
+
+        expires_at = time.monotonic() + self.ttl
+        for product_id, price in prices.items():
+            self._data[product_id] = (price, expires_at)
+            self._data.move_to_end(product_id)
+
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def get_prices(
+        self, product_ids: list[int], db: AsyncSession
+    ) -> dict[int, int]:
+        """Цены товаров: из кэша, недостающие — одним SELECT ... WHERE id IN (...)"""
+        prices, missing = self.get_many(list(set(product_ids)))
+        if missing:
+            result = await db.execute(
+                select(Product.id, Product.price).where(Product.id.in_(missing))
+            )
+            loaded = {row.id: row.price for row in result}
+            self.set_many(loaded)
+            prices.update(loaded)
+        return prices
+
+    async def warm(self, db: AsyncSession, chunk_size: int = 10000):
+        """Загружает цены первых max_size товаров при старте"""
+        start = time.perf_counter()
+        loaded = 0
+        result = await db.stream(
+            select(Product.id, Product.price)
+            .order_by(Product.id)
+            .limit(self.max_size)
+            .execution_options(yield_per=chunk_size)
+        )
+        async for rows in result.partitions():
+            self.set_many({row.id: row.price for row in rows})
+            loaded += len(rows)
+
+        logger.info(
+            f"Кэш цен прогрет: {loaded} товаров за {time.perf_counter() - start:.2f} сек"
+        )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+price_cache = PriceCache(
+    max_size=int(os.getenv("PRICE_CACHE_MAX_SIZE", "100000")),
+    ttl=float(os.getenv("PRICE_CACHE_TTL", "300")),
+)
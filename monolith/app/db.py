@@ -1,22 +1,42 @@
 import os
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(str(DATABASE_URL), echo=False)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_async_engine(
+    str(DATABASE_URL),
+    echo=False,
+    pool_size=15,
+    max_overflow=15,
+    pool_timeout=30,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+async def get_db():
+    async with AsyncSessionLocal() as session:
+        yield session
 
 
-def get_db():
-    with SessionLocal() as session:
-        yield session
+async def run_with_session(handler, *args):
+    """
+    Запускает обработчик со своей сессией — для фоновых задач: сессия запроса
+    к их запуску уже закрыта
+    """
+    async with AsyncSessionLocal() as session:
+        return await handler(*args, session)
 
 
-def create_tables():
+async def create_tables():
     from app.models import Base, Order, OrderItem, Product
 
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
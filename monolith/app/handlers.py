@@ -1,22 +1,47 @@
 import random
 
 import app.schemas as schemas
+from app.cache import price_cache
 from app.db import get_db
 from app.logger import logger
-from app.models import Order, OrderItem, Product
+from app.models import Order, OrderItem
 from fastapi import Depends
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+# Сообщения по каждому заказу — отдельный логгер для сэмплирования (LOG_SAMPLING)
+order_logger = logger.getChild("orders")
 
-def create_order_handler(order: schemas.OrderCreate, db: Session = Depends(get_db)):
+
+async def create_order_handler(
+    order: schemas.OrderCreate, db: AsyncSession = Depends(get_db)
+):
     if not order.items:
         logger.error(f"Заказ пользователя №{order.user_id} не содержит товаров")
         return {"error": "Заказ не может быть пустым"}
 
+    # Все цены до записи: из кэша, промахи — одним запросом IN
+    product_ids = [item.product_id for item in order.items]
+    prices = await price_cache.get_prices(product_ids, db)
+
+    missing_products = set(product_ids) - prices.keys()
+    if missing_products:
+        logger.error(f"Товары не найдены: {missing_products}")
+        return {"error": f"Товары не найдены: {missing_products}"}
+
+    updated_items = []
+    total_price = 0
+
+    for item in order.items:
+        unit_price = prices[item.product_id]
+        total = unit_price * item.quantity
+        total_price += total
+        updated_items.append(
+            {**item.model_dump(), "unit_price": unit_price, "total": total}
+        )
+
     new_order = Order(user_id=order.user_id)
     db.add(new_order)
-    db.flush()
+    await db.flush()
 
     order_items = [
         OrderItem(
@@ -27,24 +52,7 @@ def create_order_handler(order: schemas.OrderCreate, db: Session = Depends(get_d
         for item in order.items
     ]
     db.add_all(order_items)
-    db.commit()
-
-    updated_items = []
-    total_price = 0
-
-    for item in order.items:
-        try:
-            result = db.execute(select(Product).where(Product.id == item.product_id))
-            unit_price = result.scalars().first().price
-        except Exception as e:
-            logger.error(f"Ошибка при получении цены товара: {e}")
-            return {"error": "Товар не найден"}
-
-        total = unit_price * item.quantity
-        total_price += total
-        updated_items.append(
-            {**item.model_dump(), "unit_price": unit_price, "total": total}
-        )
+    await db.commit()
 
     updated_order = {
         "order_id": new_order.id,
@@ -53,25 +61,35 @@ def create_order_handler(order: schemas.OrderCreate, db: Session = Depends(get_d
         "total_price": total_price,
     }
 
-    logger.info(f"Успешно создан заказ №{new_order.id}")
+    order_logger.info(
+        f"Успешно создан заказ №{new_order.id}", extra={"order_id": new_order.id}
+    )
 
     return updated_order
 
 
-def payment_handler(updated_order: dict, db: Session = Depends(get_db)):
+async def payment_handler(updated_order: dict, db: AsyncSession = Depends(get_db)):
     is_success = random.randint(0, 100) >= 2
     updated_order["is_success"] = is_success
 
     if not is_success:
         logger.error(f"Ошибка при оплате заказа №{updated_order['order_id']}")
     else:
-        logger.info(f"Заказ №{updated_order['order_id']} оплачен")
+        order_logger.info(
+            f"Заказ №{updated_order['order_id']} оплачен",
+            extra={"order_id": updated_order["order_id"]},
+        )
 
     return updated_order
 
 
-def delivery_handler(updated_order: dict, status: str, db: Session = Depends(get_db)):
+async def delivery_handler(
+    updated_order: dict, status: str, db: AsyncSession = Depends(get_db)
+):
     updated_order["status"] = status
-    logger.info(f"Заказ №{updated_order['order_id']} переходит в статус {status}")
+    order_logger.info(
+        f"Заказ №{updated_order['order_id']} переходит в статус {status}",
+        extra={"order_id": updated_order["order_id"], "status": status},
+    )
 
     return updated_order
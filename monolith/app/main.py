@@ -2,9 +2,11 @@ from contextlib import asynccontextmanager
 
 import app.handlers as handlers
 import app.schemas as schemas
-from app.db import create_tables, get_db
+from app.cache import price_cache
+from app.db import AsyncSessionLocal, create_tables, get_db, run_with_session
+from app.logger import logger
 from fastapi import Depends, FastAPI
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import BackgroundTasks
 
 statuses = ["in_assembly", "on_the_way", "delivered"]
@@ -12,7 +14,14 @@ statuses = ["in_assembly", "on_the_way", "delivered"]
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    create_tables()
+    await create_tables()
+
+    try:
+        async with AsyncSessionLocal() as session:
+            await price_cache.warm(session)
+    except Exception as e:
+        logger.error(f"Ошибка при прогреве кэша цен: {e}")
+
     yield
 
 
@@ -24,20 +33,32 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/cache/stats", tags=["health"])
+async def cache_stats():
+    """Статистика in-process кэша цен"""
+    return price_cache.stats()
+
+
 @app.post("/orders", tags=["orders"])
 async def create_order(
     order: schemas.OrderCreate,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    updated_order = handlers.create_order_handler(order, db)
-    updated_order = handlers.payment_handler(updated_order, db)
+    updated_order = await handlers.create_order_handler(order, db)
+    if "error" in updated_order:
+        return updated_order
+
+    updated_order = await handlers.payment_handler(updated_order, db)
 
     if not updated_order["is_success"]:
         return {"error": "Ошибка при оплате заказа"}
 
     for status in statuses:
         # updated_order = handlers.delivery_handler(updated_order, status, db)
-        background_tasks.add_task(handlers.delivery_handler, updated_order, status, db)
+        # У каждой фоновой задачи своя сессия: сессия запроса уже закрыта
+        background_tasks.add_task(
+            run_with_session, handlers.delivery_handler, updated_order, status
+        )
 
     return updated_order
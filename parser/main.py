@@ -1,9 +1,11 @@
+import argparse
 import json
 import os
 import random
 import asyncio
+import time
 from dotenv import load_dotenv
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, insert
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 
@@ -45,37 +47,190 @@ async def get_db():
         yield session
 
 
-# Пример получения товаров из DNS
-async def get_dns_products():
-    # url = "https://dummyjson.com/products?limit=1000"
-
-    # headers = {
-    #     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-    #     "Accept": "application/json",
-    # }
-
-    # response = requests.get(url, headers=headers)
-
-    # print('Got data from dummyjson!')
-
-    import json
-    products = {}
-    with open('data.json') as f:
-        products_data = json.load(f)
-
-    for product in products_data["products"]:
-        unit_price = random.randint(1000, 15000)
-        name = product["title"]
-
-        products[name] = unit_price
-
-    # add to database
-    async with engine.begin() as conn:
+def iter_json_products(path: str, key: str = "products", read_size: int = 1 << 16):
+    """
+    Потоково читает объекты из массива {"products": [...]} (формат dummyjson)
+    без загрузки всего файла в память
+    """
+    decoder = json.JSONDecoder()
+
+    with open(path, encoding="utf-8") as f:
+        # Ищем начало массива
+        buffer = ""
+        while True:
+            data = f.read(read_size)
+            buffer += data
+            key_pos = buffer.find(f'"{key}"')
+            start = buffer.find("[", key_pos) if key_pos != -1 else -1
+            if start != -1:
+                buffer = buffer[start + 1 :]
+                break
+            if not data:
+                return
+
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+
+            try:
+                product, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Объект не поместился в буфер — дочитываем файл
+                data = f.read(read_size)
+                if not data:
+                    raise
+                buffer = buffer[pos:] + data
+                pos = 0
+                continue
+
+            yield product
+
+            if pos > read_size:
+                buffer = buffer[pos:]
+                pos = 0
+
+
+def iter_ndjson_products(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_source_products(path: str, rows: int | None):
+    """
+    Товары из файла; если rows больше числа товаров в файле,
+    файл читается повторно, к названию добавляется номер прохода
+    """
+    reader = iter_ndjson_products if path.endswith(".ndjson") else iter_json_products
+    produced = 0
+    round_no = 0
+
+    while rows is None or produced < rows:
+        round_produced = 0
+        for product in reader(path):
+            name = product["title"]
+            if round_no:
+                name = f"{name} #{round_no}"
+
+            yield {"name": name, "price": random.randint(1000, 15000)}
+            produced += 1
+            round_produced += 1
+            if rows is not None and produced >= rows:
+                return
+
+        if rows is None or not round_produced:
+            return
+        round_no += 1
+
+
+def iter_synthetic_products(rows: int):
+    for i in range(1, rows + 1):
+        yield {"name": f"Товар {i}", "price": random.randint(1000, 15000)}
+
+
+def iter_batches(products, batch_size: int):
+    batch = []
+    for product in products:
+        batch.append(product)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def insert_batch_copy(conn, batch: list[dict]):
+    """COPY через asyncpg: самый быстрый путь для PostgreSQL"""
+    raw_connection = await conn.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        Product.__tablename__,
+        records=[(product["name"], product["price"]) for product in batch],
+        columns=["name", "price"],
+    )
+
+
+async def insert_batch_executemany(conn, batch: list[dict]):
+    """Многострочный INSERT (executemany через insertmanyvalues)"""
+    await conn.execute(insert(Product), batch)
+
+
+async def load_products(products, batch_size: int, method: str):
+    insert_batch = insert_batch_copy if method == "copy" else insert_batch_executemany
+
+    async with engine.connect() as conn:
         await conn.run_sync(Base.metadata.create_all)
-        for name, price in products.items():
-            product = Product(name=name, price=price)
-            await conn.execute(product.__table__.insert(), product.__dict__)
+        await conn.commit()
+
+        loaded = 0
+        start = time.perf_counter()
+        for batch in iter_batches(products, batch_size):
+            await insert_batch(conn, batch)
+            # Коммит на каждую пачку: прогресс не теряется при обрыве загрузки
+            await conn.commit()
+
+            loaded += len(batch)
+            elapsed = time.perf_counter() - start
+            print(
+                f"Загружено {loaded} товаров, {loaded / elapsed:.0f} строк/с",
+                end="\r",
+                flush=True,
+            )
+
+    elapsed = time.perf_counter() - start
+    rate = loaded / elapsed if elapsed else 0
+    print(f"\nЗагружено {loaded} товаров за {elapsed:.2f} сек ({rate:.0f} строк/с)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Загрузка товаров в PostgreSQL")
+    parser.add_argument(
+        "--input",
+        default="data.json",
+        help="файл с товарами: JSON dummyjson ({'products': [...]}) или .ndjson",
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        default=None,
+        help="сколько товаров загрузить (по умолчанию — все товары из файла)",
+    )
+    parser.add_argument(
+        "--synthetic",
+        action="store_true",
+        help="генерировать товары вместо чтения файла (требует --rows)",
+    )
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument(
+        "--method",
+        choices=["copy", "insert"],
+        default="copy",
+        help="copy — COPY через asyncpg, insert — многострочный INSERT",
+    )
+    args = parser.parse_args()
+
+    if args.synthetic and args.rows is None:
+        parser.error("--synthetic требует --rows")
+    return args
+
+
+async def main():
+    args = parse_args()
+
+    if args.synthetic:
+        products = iter_synthetic_products(args.rows)
+    else:
+        products = iter_source_products(args.input, args.rows)
+
+    try:
+        await load_products(products, args.batch_size, args.method)
+    finally:
+        await engine.dispose()
 
 
 if __name__ == "__main__":
-    asyncio.run(get_dns_products())
+    asyncio.run(main())
@@ -1,53 +1,423 @@
-import aiohttp
+"""
+Нагрузочный тест с открытой моделью нагрузки: запросы отправляются с постоянной
+интенсивностью (--rate) независимо от того, ответил ли сервер на предыдущие.
+Задержка считается от запланированного момента отправки, поэтому очередь на
+стороне сервиса видна в перцентилях (нет coordinated omission).
+
+Сценарии выбираются по весам (--scenario name=weight):
+- create_order — POST /orders, 1–3 товара из реального диапазона id
+- list_orders  — GET /orders?user_id=...&limit=10
+- get_products — GET /products?skip=...&limit=10
+
+id товаров читаются из GET /products; если эндпоинта нет (монолит) —
+используется --products. Сценарии, эндпоинт которых отвечает 404/405,
+отключаются с предупреждением.
+
+Запуск:
+    python main.py http://localhost:9000 --rate 50 --duration 60 --output monolith.json
+    python main.py http://localhost:8001 --rate 500 --duration 60 --output ms.json
+"""
+
+import argparse
 import asyncio
+import json
 import random
 import sys
 import time
+from collections import Counter
+
+import aiohttp
+
+DEFAULT_SCENARIOS = {"create_order": 8, "list_orders": 1, "get_products": 1}
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+class LatencyHistogram:
+    """
+    Гистограмма в стиле HDR: значения в микросекундах, логарифмические
+    интервалы с линейным разбиением внутри (SUB_BUCKET_BITS бит точности).
+    Относительная ошибка не больше 1/2^(SUB_BUCKET_BITS-1), память не
+    зависит от числа запросов
+    """
+
+    SUB_BUCKET_BITS = 7
+
+    def __init__(self):
+        self.counts: Counter[int] = Counter()
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _bucket(self, value: int) -> tuple[int, int]:
+        """Нижняя граница интервала и его ширина"""
+        shift = max(value.bit_length() - self.SUB_BUCKET_BITS, 0)
+        return (value >> shift) << shift, 1 << shift
+
+    def record(self, seconds: float):
+        value = max(int(seconds * 1_000_000), 0)
+        lower, _ = self._bucket(value)
+        self.counts[lower] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def percentile(self, percent: float) -> int:
+        if not self.count:
+            return 0
+        target = max(int(self.count * percent / 100 + 0.5), 1)
+        seen = 0
+        for lower in sorted(self.counts):
+            seen += self.counts[lower]
+            if seen >= target:
+                # Верхняя граница интервала, как highest equivalent value в HDR
+                _, width = self._bucket(lower)
+                return min(lower + width - 1, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """Перцентили в миллисекундах"""
+        result = {
+            "count": self.count,
+            "min_ms": (self.min or 0) / 1000,
+            "mean_ms": round(self.total / self.count / 1000, 3) if self.count else 0,
+            "max_ms": self.max / 1000,
+        }
+        for percent in PERCENTILES:
+            result[f"p{percent:g}_ms".replace(".", "")] = (
+                self.percentile(percent) / 1000
+            )
+        return result
+
+
+class ScenarioStats:
+    def __init__(self):
+        # От запланированного момента отправки — включает ожидание в очереди клиента
+        self.latency = LatencyHistogram()
+        # От фактической отправки — только время ответа сервиса
+        self.service_time = LatencyHistogram()
+        self.ok = 0
+        self.errors: Counter[str] = Counter()
+
+    def summary(self) -> dict:
+        return {
+            "requests": self.ok + sum(self.errors.values()),
+            "ok": self.ok,
+            "errors": dict(self.errors),
+            "latency": self.latency.summary(),
+            "service_time": self.service_time.summary(),
+        }
+
+
+class LoadTest:
+    def __init__(self, args, session: aiohttp.ClientSession):
+        self.args = args
+        self.host = args.host.rstrip("/")
+        self.session = session
+        self.rng = random.Random(args.seed)
+        self.product_ids: list[int] = []
+        self.scenarios = dict(args.scenarios)
+        self.skipped: dict[str, str] = {}
+        self.stats = {name: ScenarioStats() for name in self.scenarios}
+        self.in_flight = 0
+        self.dropped = 0
+        self.sent = 0
+
+    # --- Подготовка ---
+
+    async def load_product_ids(self):
+        """Все id товаров постранично из GET /products"""
+        ids = []
+        skip = 0
+        page_size = 1000
+        while True:
+            async with self.session.get(
+                f"{self.host}/products", params={"skip": skip, "limit": page_size}
+            ) as response:
+                if response.status != 200:
+                    break
+                page = await response.json()
+            if not page:
+                break
+            ids.extend(product["id"] for product in page)
+            skip += len(page)
+
+        if ids:
+            self.product_ids = sorted(set(ids))
+            print(
+                f"Товары из API: {len(self.product_ids)} "
+                f"(id {self.product_ids[0]}–{self.product_ids[-1]})",
+                file=sys.stderr,
+            )
+        else:
+            first, last = map(int, self.args.products.split("-"))
+            self.product_ids = list(range(first, last + 1))
+            print(
+                f"GET /products недоступен, используются id {self.args.products}",
+                file=sys.stderr,
+            )
+
+    async def probe_scenarios(self):
+        """Отключает сценарии, эндпоинтов которых нет у сервиса"""
+        probes = {
+            "list_orders": f"{self.host}/orders?limit=1",
+            "get_products": f"{self.host}/products?limit=1",
+        }
+        for name, url in probes.items():
+            if name not in self.scenarios:
+                continue
+            async with self.session.get(url) as response:
+                if response.status in (404, 405):
+                    self.skipped[name] = f"HTTP {response.status}"
+                    del self.scenarios[name]
+                    del self.stats[name]
+                    print(
+                        f"Сценарий {name} отключен: {url} -> {response.status}",
+                        file=sys.stderr,
+                    )
+
+    # --- Запросы сценариев ---
+
+    def build_request(self, name: str) -> tuple[str, str, dict]:
+        if name == "create_order":
+            items = [
+                {
+                    "product_id": product_id,
+                    "quantity": self.rng.randint(1, 5),
+                }
+                for product_id in self.rng.sample(
+                    self.product_ids, min(self.rng.randint(1, 3), len(self.product_ids))
+                )
+            ]
+            body = {"user_id": self.rng.randint(1, self.args.users), "items": items}
+            return "POST", f"{self.host}/orders", {"json": body}
+
+        if name == "list_orders":
+            params = {"user_id": self.rng.randint(1, self.args.users), "limit": 10}
+            return "GET", f"{self.host}/orders", {"params": params}
+
+        if name == "get_products":
+            skip = self.rng.randrange(0, max(len(self.product_ids) - 10, 1))
+            return (
+                "GET",
+                f"{self.host}/products",
+                {"params": {"skip": skip, "limit": 10}},
+            )
+
+        raise ValueError(f"Неизвестный сценарий: {name}")
+
+    async def fire(self, name: str, scheduled: float, measured: bool):
+        loop = asyncio.get_running_loop()
+        method, url, kwargs = self.build_request(name)
+        stats = self.stats[name]
+        sent = loop.time()
+        try:
+            async with self.session.request(method, url, **kwargs) as response:
+                body = await response.read()
+                if response.status >= 400:
+                    error = f"http_{response.status}"
+                elif b'"error"' in body:
+                    # Монолит возвращает ошибки бизнес-логики с кодом 200
+                    error = "app_error"
+                else:
+                    error = None
+        except asyncio.TimeoutError:
+            error = "timeout"
+        except aiohttp.ClientError as e:
+            error = type(e).__name__
+        finally:
+            self.in_flight -= 1
+
+        if not measured:
+            return
+        done = loop.time()
+        stats.latency.record(done - scheduled)
+        stats.service_time.record(done - sent)
+        if error:
+            stats.errors[error] += 1
+        else:
+            stats.ok += 1
+
+    # --- Генератор нагрузки ---
+
+    def next_interval(self) -> float:
+        if self.args.arrival == "poisson":
+            return self.rng.expovariate(self.args.rate)
+        return 1 / self.args.rate
+
+    async def run(self) -> float:
+        loop = asyncio.get_running_loop()
+        names = list(self.scenarios)
+        weights = [self.scenarios[name] for name in names]
+        tasks = set()
+
+        start = loop.time()
+        warmup_end = start + self.args.warmup
+        end = warmup_end + self.args.duration
+        scheduled = start
+
+        while scheduled < end:
+            now = loop.time()
+            if scheduled > now:
+                await asyncio.sleep(scheduled - now)
+
+            # Все запросы, время которых наступило, отправляются сразу —
+            # отставание планировщика не снижает интенсивность
+            now = loop.time()
+            while scheduled <= now and scheduled < end:
+                measured = scheduled >= warmup_end
+                if self.in_flight >= self.args.max_in_flight:
+                    # Клиент упёрся в лимит соединений: запрос не отправлен
+                    if measured:
+                        self.dropped += 1
+                else:
+                    self.in_flight += 1
+                    if measured:
+                        self.sent += 1
+                    name = self.rng.choices(names, weights)[0]
+                    task = asyncio.create_task(self.fire(name, scheduled, measured))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                scheduled += self.next_interval()
 
-host = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:9000"
-request_count = 200
-concurrency = 5  # сколько запросов одновременно
+        if tasks:
+            await asyncio.gather(*tasks)
+        return loop.time() - warmup_end
 
-headers = {
-    "Content-Type": "application/json",
-}
+    def results(self, elapsed: float) -> dict:
+        total = Counter()
+        for stats in self.stats.values():
+            total["ok"] += stats.ok
+            total["errors"] += sum(stats.errors.values())
+        return {
+            "host": self.host,
+            "started_at": self.args.started_at,
+            "config": {
+                "rate": self.args.rate,
+                "arrival": self.args.arrival,
+                "duration": self.args.duration,
+                "warmup": self.args.warmup,
+                "scenarios": self.scenarios,
+                "skipped_scenarios": self.skipped,
+                "users": self.args.users,
+                "products": len(self.product_ids),
+                "max_in_flight": self.args.max_in_flight,
+                "timeout": self.args.timeout,
+                "seed": self.args.seed,
+            },
+            "elapsed": round(elapsed, 3),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "ok": total["ok"],
+            "errors": total["errors"],
+            # Интенсивность за окно отправки; elapsed включает дожидание ответов
+            "achieved_rate": round(self.sent / self.args.duration, 2),
+            "throughput": round(total["ok"] / elapsed, 2) if elapsed else 0,
+            "scenarios": {name: stats.summary() for name, stats in self.stats.items()},
+        }
 
-count = 0
 
+def print_report(results: dict):
+    print(
+        f"\n{results['host']}: отправлено {results['sent']} "
+        f"({results['achieved_rate']} запросов/с из {results['config']['rate']}), "
+        f"успешно {results['ok']}, ошибок {results['errors']}, "
+        f"не отправлено {results['dropped']}"
+    )
+    header = f"{'сценарий':<14}{'запросов':>10}{'ошибок':>8}"
+    header += "".join(f"{'p' + format(p, 'g'):>10}" for p in PERCENTILES)
+    header += f"{'max':>10}"
+    print(header)
+    for name, scenario in results["scenarios"].items():
+        latency = scenario["latency"]
+        row = (
+            f"{name:<14}{scenario['requests']:>10}{sum(scenario['errors'].values()):>8}"
+        )
+        row += "".join(
+            f"{latency[f'p{p:g}_ms'.replace('.', '')]:>10.1f}" for p in PERCENTILES
+        )
+        row += f"{latency['max_ms']:>10.1f}"
+        print(row)
+    print("Задержки в мс от запланированного времени отправки")
 
-async def send_request(session, i):
-    global count
 
-    data = {
-        "user_id": random.randint(1, 500),
-        "items": [
-            {"product_id": random.randint(1, 190), "quantity": random.randint(1, 5)}
-        ],
-    }
-    async with session.post(
-        f"{host}/orders", json=data, headers=headers
-    ) as response:
-        count += 1
-        print(f"{count}/{request_count}", end="\r")
-        pass
+def parse_scenarios(values: list[str] | None) -> dict[str, float]:
+    if not values:
+        return dict(DEFAULT_SCENARIOS)
+    scenarios = {}
+    for value in values:
+        for item in value.split(","):
+            name, _, weight = item.partition("=")
+            if name not in DEFAULT_SCENARIOS:
+                raise SystemExit(f"Неизвестный сценарий: {name}")
+            scenarios[name] = float(weight or 1)
+    return {name: weight for name, weight in scenarios.items() if weight > 0}
 
 
-async def bounded_send(semaphore, session, i):
-    async with semaphore:
-        await send_request(session, i)
+async def main(args):
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.max_in_flight)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        load_test = LoadTest(args, session)
+        await load_test.load_product_ids()
+        await load_test.probe_scenarios()
+        if not load_test.scenarios:
+            raise SystemExit("Нет доступных сценариев")
 
+        print(
+            f"Нагрузка {args.rate} запросов/с, {args.warmup} + {args.duration} сек, "
+            f"сценарии {load_test.scenarios}",
+            file=sys.stderr,
+        )
+        elapsed = await load_test.run()
+        return load_test.results(elapsed)
 
-async def main():
-    start = time.time()
-    semaphore = asyncio.Semaphore(concurrency)
-    async with aiohttp.ClientSession() as session:
-        tasks = [
-            bounded_send(semaphore, session, i) for i in range(1, request_count + 1)
-        ]
-        await asyncio.gather(*tasks)
-    end = time.time()
-    print(f"\nОбщее время выполнения: {end - start:.2f} секунд(ы)")
-    print(f"Запросов в секунду: {request_count / (end - start):.2f}")
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("host", nargs="?", default="http://localhost:9000")
+    parser.add_argument("--rate", type=float, default=50, help="запросов в секунду")
+    parser.add_argument("--duration", type=float, default=30, help="секунд замера")
+    parser.add_argument(
+        "--warmup", type=float, default=5, help="секунд прогрева (не в результатах)"
+    )
+    parser.add_argument(
+        "--arrival",
+        choices=("constant", "poisson"),
+        default="constant",
+        help="равные интервалы или пуассоновский поток",
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        dest="scenario",
+        help="сценарий и вес, например create_order=8,list_orders=1",
+    )
+    parser.add_argument(
+        "--products", default="1-190", help="диапазон id, если нет GET /products"
+    )
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=10000,
+        help="лимит одновременных запросов; сверх него запросы не отправляются",
+    )
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument(
+        "--output", help="файл для результатов в JSON (по умолчанию только вывод)"
+    )
+    args = parser.parse_args()
+    args.scenarios = parse_scenarios(args.scenario)
+    args.started_at = time.strftime("%Y-%m-%dT%H:%M:%S%z")
 
-asyncio.run(main())
+    results = asyncio.run(main(args))
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Результаты записаны в {args.output}")